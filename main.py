@@ -22,7 +22,8 @@ async def main():
         
         # 初始化组件
         collector = WebCollector(
-            timeout=config.get('collector.timeout', 30)
+            timeout=config.get('collector.timeout', 30),
+            js_library_probes=config.get('collector.js_libraries')
         )
         
         database = Database(
@@ -39,26 +40,30 @@ async def main():
             raise ValueError("未设置 Telegram Bot Token")
         
         # 创建 Bot
-        bot = WebTemplateBot(token, database, collector, analyzer)
-        
-        # 启动 Bot
-        await bot.start()
-        
-        # 等待中断信号
-        stop = asyncio.Future()
-        
-        def signal_handler():
-            stop.set_result(None)
-        
-        for sig in (signal.SIGINT, signal.SIGTERM):
-            loop = asyncio.get_running_loop()
-            loop.add_signal_handler(sig, signal_handler)
-        
-        logger.info("Bot is ready. Press Ctrl+C to stop")
-        await stop
+        bot = WebTemplateBot(
+            token, database, collector, analyzer,
+            concurrency=config.get('collector.concurrency', 4)
+        )
         
-        # 停止 Bot
-        await bot.stop()
+        # 启动浏览器和 Bot，无论 Bot 启动或停止是否出错都关闭浏览器
+        async with collector:
+            await bot.start()
+            try:
+                # 等待中断信号
+                stop = asyncio.Future()
+                
+                def signal_handler():
+                    stop.set_result(None)
+                
+                for sig in (signal.SIGINT, signal.SIGTERM):
+                    loop = asyncio.get_running_loop()
+                    loop.add_signal_handler(sig, signal_handler)
+                
+                logger.info("Bot is ready. Press Ctrl+C to stop")
+                await stop
+            finally:
+                # 停止 Bot
+                await bot.stop()
         
     except Exception as e:
         logger.error(f"程序启动失败: {str(e)}")
@@ -1,40 +1,61 @@
-from telegram import Update, Document
+from telegram import Update, Document, Message
+from telegram.constants import ChatAction
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+import asyncio
 import logging
-from typing import Optional
-from urllib.parse import urlparse
+from typing import List, Optional, Set
 from .collector import WebCollector
-from .database import Database
+from .database import Database, _url_host
 from .similarity import SimilarityAnalyzer
 from datetime import datetime
-from .collector import WebsiteFeatures
-import tempfile
-import os
+import io
+import re
+
+# 仅接受可由浏览器打开的 http/https 地址，须用 fullmatch 匹配整个字符串
+_URL_RE = re.compile(r'https?://[^\s/$.?#][^\s]*', re.IGNORECASE)
+
+# 单条回复消息的长度上限，留出余量避免超过 Telegram 的 4096 字符限制
+_MAX_MESSAGE_LENGTH = 3500
 
 class WebTemplateBot:
     """Telegram Bot 实现"""
     
-    def __init__(self, token: str, db: Database, collector: WebCollector, analyzer: SimilarityAnalyzer):
+    def __init__(self, token: str, db: Database, collector: WebCollector, analyzer: SimilarityAnalyzer,
+                 concurrency: int = 4):
         self.token = token
         self.db = db
         self.collector = collector
         self.analyzer = analyzer
+        self.concurrency = concurrency
         self.logger = logging.getLogger(__name__)
         
-        # 创建应用
-        self.app = Application.builder().token(token).build()
+        # 待分析的URL队列，由固定数量的工作协程消费，限制同时打开的页面数
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._busy_workers = 0
+        # 已入队或正在分析、尚未入库的域名，同一域名只分析一次
+        self._pending_hosts: Set[str] = set()
+        
+        # 创建应用，允许并发处理更新，避免耗时的网站分析阻塞其他用户的命令
+        self.app = Application.builder().token(token).concurrent_updates(True).build()
         
         # 注册处理器
-        self.app.add_handler(CommandHandler("start", self.start_command))
-        self.app.add_handler(CommandHandler("help", self.help_command))
-        self.app.add_handler(CommandHandler("stats", self.stats_command))
-        self.app.add_handler(CommandHandler("template", self.template_command))
-        self.app.add_handler(CommandHandler("list", self.list_command))
-        self.app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
+        self.app.add_handler(CommandHandler("start", self.start_command, block=False))
+        self.app.add_handler(CommandHandler("help", self.help_command, block=False))
+        self.app.add_handler(CommandHandler("stats", self.stats_command, block=False))
+        self.app.add_handler(CommandHandler("template", self.template_command, block=False))
+        self.app.add_handler(CommandHandler("list", self.list_command, block=False))
+        self.app.add_handler(
+            MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message, block=False)
+        )
 
     async def start(self):
         """启动机器人"""
         await self.db.initialize()
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._analysis_worker()) for _ in range(self.concurrency)
+        ]
         self.logger.info("Starting bot...")
         await self.app.initialize()
         await self.app.start()
@@ -46,6 +67,17 @@ class WebTemplateBot:
         self.logger.info("Stopping bot...")
         await self.app.updater.stop()
         await self.app.stop()
+        # 还在排队的网站不会再被分析，通知这些用户重新发送
+        while self._queue is not None and not self._queue.empty():
+            message, wait_message = self._queue.get_nowait()
+            self._queue.task_done()
+            self._pending_hosts.discard(_url_host(message))
+            await self._notify_shutdown(wait_message)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await self.db.close()
         self.logger.info("Bot stopped")
 
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -73,17 +105,17 @@ class WebTemplateBot:
         """处理 /stats 命令"""
         stats = await self.db.get_statistics()
         
-        stats_text = (
+        parts = [
             "📊 统计信息：\n\n"
             f"总网站数：{stats['total_websites']}\n"
             f"模板数量：{stats['total_templates']}\n\n"
             "最近分析的网站：\n"
+        ]
+        parts.extend(
+            f"• {site['url']} ({site['last_updated_at']})\n" for site in stats['recent_websites']
         )
-        
-        for site in stats['recent_websites']:
-            stats_text += f"• {site['url']} ({site['last_updated_at']})\n"
             
-        await update.message.reply_text(stats_text)
+        await update.message.reply_text("".join(parts))
 
     async def template_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """处理 /template 命令"""
@@ -98,11 +130,25 @@ class WebTemplateBot:
             await update.message.reply_text(f"未找到ID为 {template_id} 的模板")
             return
             
-        response = f"📑 模板 #{template_id} 的网站列表：\n\n"
+        # Telegram 单条消息最多 4096 个字符，网站较多时分多条发送
+        buf = [f"📑 模板 #{template_id} 的网站列表：\n\n"]
+        size = len(buf[0])
         for site in websites:
-            response += f"• {site['url']}\n"
+            line = f"• {site['url']}\n"
+            if size + len(line) > _MAX_MESSAGE_LENGTH and buf:
+                await update.message.reply_text("".join(buf))
+                buf.clear()
+                size = 0
+            if len(line) > _MAX_MESSAGE_LENGTH:
+                # 单个网址本身超过上限时只能拆成多条发送
+                for start in range(0, len(line), _MAX_MESSAGE_LENGTH):
+                    await update.message.reply_text(line[start:start + _MAX_MESSAGE_LENGTH])
+                continue
+            buf.append(line)
+            size += len(line)
             
-        await update.message.reply_text(response)
+        if buf:
+            await update.message.reply_text("".join(buf))
 
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """处理用户消息"""
@@ -116,61 +162,89 @@ class WebTemplateBot:
             await update.message.reply_text("请发送有效的网站URL")
             return
             
-        # 发送等待消息
-        wait_message = await update.message.reply_text("🔍 正在分析网站，请稍候...")
-        
+        wait_message = None
         try:
             # 首先检查域名是否已存在
             existing_website = await self.db.get_website_by_host(message)
             if existing_website:
-                template_id = existing_website.get('template_id')
-                if template_id:
-                    response_text = [
-                        "✅ 网站已存在于数据库中！\n",
-                        f"URL: {existing_website['url']}\n",
-                        f"模板 ID: #{template_id}\n",
-                        f"首次分析时间: {existing_website['first_analyzed_at']}\n",
-                        f"最后更新时间: {existing_website['last_updated_at']}"
-                    ]
-                else:
-                    response_text = [
-                        "✅ 网站已存在于数据库中！\n",
-                        f"URL: {existing_website['url']}\n",
-                        "该网站尚未归类到任何模板",
-                        f"首次分析时间: {existing_website['first_analyzed_at']}\n",
-                        f"最后更新时间: {existing_website['last_updated_at']}"
-                    ]
-                
-                await wait_message.edit_text("\n".join(response_text))
+                # 查库很快，直接回复，不必先发送等待消息再编辑
+                await update.message.reply_text(self._existing_website_text(existing_website))
+                return
+            
+            # 同一域名已在队列中或正在分析，结果入库前不再重复分析
+            host = _url_host(message)
+            if host in self._pending_hosts:
+                await update.message.reply_text("⏳ 该网站正在分析中，请稍后重新发送查看结果")
+                return
+            
+            # 如果域名不存在，发送等待消息并加入分析队列，之后原地编辑该消息
+            # 排队的网站加上所有工作协程都忙时需要等它空出来的那一个
+            ahead = self._queue.qsize() + max(0, self._busy_workers - self.concurrency + 1)
+            if ahead:
+                wait_text = f"⏳ 已加入分析队列，前面还有 {ahead} 个网站，请稍候..."
+            else:
+                wait_text = "🔍 正在分析网站，请稍候..."
+            self._pending_hosts.add(host)
+            try:
+                wait_message = await update.message.reply_text(wait_text)
+                await self._queue.put((message, wait_message))
+            except Exception:
+                self._pending_hosts.discard(host)
+                raise
+            
+        except Exception as e:
+            self.logger.error(f"处理URL时出错: {str(e)}")
+            error_text = (
+                "❌ 分析过程中出现错误，请稍后重试\n"
+                f"错误信息: {str(e)}"
+            )
+            if wait_message:
+                await wait_message.edit_text(error_text)
+            else:
+                await update.message.reply_text(error_text)
+
+    async def _notify_shutdown(self, wait_message: Message):
+        """把未完成分析的等待消息改为机器人关闭提示"""
+        try:
+            await wait_message.edit_text("⚠️ 机器人正在关闭，本次分析未完成，请稍后重新发送该网址")
+        except Exception as e:
+            self.logger.error(f"发送关闭提示失败: {str(e)}")
+
+    async def _analysis_worker(self):
+        """从队列中取出URL逐个分析"""
+        while True:
+            message, wait_message = await self._queue.get()
+            self._busy_workers += 1
+            try:
+                await self._analyze_and_reply(message, wait_message)
+            except asyncio.CancelledError:
+                # 关闭时正在进行的分析被取消
+                await self._notify_shutdown(wait_message)
+                raise
+            finally:
+                self._pending_hosts.discard(_url_host(message))
+                self._busy_workers -= 1
+                self._queue.task_done()
+
+    async def _analyze_and_reply(self, message: str, wait_message: Message):
+        """分析网站、归类模板，并把结果编辑到等待消息中"""
+        try:
+            # 排队期间同一域名的其他网址可能已经分析入库
+            existing_website = await self.db.get_website_by_host(message)
+            if existing_website:
+                await wait_message.edit_text(self._existing_website_text(existing_website))
                 return
             
-            # 如果域名不存在，继续进行分析
             features = await self.collector.analyze_url(message)
             if not features:
                 await wait_message.edit_text("❌ 无法分析该网站，请确保网站可访问")
                 return
                 
-            # 存储网站信息
-            website_id = await self.db.add_website(message, features)
-            
             # 获取所有现有模板
-            templates = await self.db.get_all_templates()
+            templates = await self.db.get_template_features()
             
             # 寻找最相似的模板
-            max_similarity = 0
-            similar_template_id = None
-            
-            for template_id, template_features in templates:
-                # 将模板特征转换为 WebsiteFeatures 对象
-                template_features['created_at'] = datetime.fromisoformat(template_features['created_at'])
-                template_features['updated_at'] = datetime.fromisoformat(template_features['updated_at'])
-                template_obj = WebsiteFeatures(**template_features)
-                
-                # 计算相似度
-                similarity = self.analyzer.calculate_similarity(features, template_obj)
-                if similarity > max_similarity:
-                    max_similarity = similarity
-                    similar_template_id = template_id
+            similar_template_id, max_similarity = self.analyzer.find_best_match(features, templates)
 
             # 构建响应消息
             response_text = [
@@ -179,16 +253,15 @@ class WebTemplateBot:
                 f"特征数: {len(features.css_classes)} CSS类, {len(features.js_libraries)} JS库"
             ]
 
-            # 根据相似度决定是创建新模板还是使用现有模板
+            # 根据相似度决定是创建新模板还是使用现有模板，网站信息在同一事务中存储
             if max_similarity >= self.analyzer.threshold and similar_template_id:
                 # 使用现有模板
-                await self.db.update_website_template(website_id, similar_template_id)
-                await self.db.update_template_count(similar_template_id)
+                await self.db.save_website(message, features, similar_template_id)
                 response_text.append(f"\n\n🔍 匹配到现有模板 #{similar_template_id}")
                 response_text.append(f"相似度: {max_similarity:.2%}")
             else:
                 # 创建新模板
-                new_template_id = await self.db.create_template_from_website(website_id)
+                _, new_template_id = await self.db.save_website(message, features)
                 response_text.append(f"\n\n🆕 创建新模板 #{new_template_id}")
                 response_text.append("没有找到足够相似的现有模板")
             
@@ -200,61 +273,73 @@ class WebTemplateBot:
             
         except Exception as e:
             self.logger.error(f"处理URL时出错: {str(e)}")
-            await wait_message.edit_text(
-                "❌ 分析过程中出现错误，请稍后重试\n"
-                f"错误信息: {str(e)}"
-            )
+            try:
+                await wait_message.edit_text(
+                    "❌ 分析过程中出现错误，请稍后重试\n"
+                    f"错误信息: {str(e)}"
+                )
+            except Exception as edit_error:
+                self.logger.error(f"发送错误信息失败: {str(edit_error)}")
 
     async def list_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """处理 /list 命令，生成并发送网站列表文件"""
         try:
-            # 发送等待消息
-            wait_message = await update.message.reply_text("正在生成网站列表，请稍候...")
+            # 显示“正在发送文件”状态，代替发送后再删除的等待消息
+            await update.message.reply_chat_action(ChatAction.UPLOAD_DOCUMENT)
             
             # 获取分组数据
             templates = await self.db.get_grouped_websites()
             
-            # 创建临时文件
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8') as f:
-                f.write("网站模板分组列表\n")
-                f.write(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write("=" * 50 + "\n\n")
-                
-                for template in templates:
-                    f.write(f"模板 #{template['template_id']}\n")
-                    f.write(f"创建时间: {template['created_at']}\n")
-                    f.write(f"网站数量: {template['website_count']}\n")
-                    f.write("\n网站列表:\n")
-                    
-                    for website in template['websites']:
-                        f.write(f"- {website['url']}\n")
-                    
-                    f.write("\n" + "-" * 30 + "\n\n")
-                
-                filename = f.name
-
-            # 发送文件
-            with open(filename, 'rb') as f:
-                await update.message.reply_document(
-                    document=f,
-                    filename="website_templates.txt",
-                    caption="📋 这是所有网站的分组列表"
-                )
-            
-            # 删除临时文件
-            os.unlink(filename)
+            parts = [
+                "网站模板分组列表\n",
+                f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n",
+                "=" * 50 + "\n\n",
+            ]
             
-            # 删除等待消息
-            await wait_message.delete()
+            for template in templates:
+                parts.append(
+                    f"模板 #{template['template_id']}\n"
+                    f"创建时间: {template['created_at']}\n"
+                    f"网站数量: {template['website_count']}\n"
+                    "\n网站列表:\n"
+                )
+                parts.extend(f"- {website['url']}\n" for website in template['websites'])
+                parts.append("\n" + "-" * 30 + "\n\n")
+
+            # 在内存中生成文件并直接发送，无需落盘
+            document = io.BytesIO("".join(parts).encode('utf-8'))
+            await update.message.reply_document(
+                document=document,
+                filename="website_templates.txt",
+                caption="📋 这是所有网站的分组列表"
+            )
             
         except Exception as e:
             self.logger.error(f"生成列表失败: {str(e)}")
             await update.message.reply_text("❌ 生成列表时出现错误，请稍后重试")
 
+    def _existing_website_text(self, website: dict) -> str:
+        """生成网站已在数据库中时的回复"""
+        template_id = website.get('template_id')
+        if template_id:
+            response_text = [
+                "✅ 网站已存在于数据库中！\n",
+                f"URL: {website['url']}\n",
+                f"模板 ID: #{template_id}\n",
+                f"首次分析时间: {website['first_analyzed_at']}\n",
+                f"最后更新时间: {website['last_updated_at']}"
+            ]
+        else:
+            response_text = [
+                "✅ 网站已存在于数据库中！\n",
+                f"URL: {website['url']}\n",
+                "该网站尚未归类到任何模板",
+                f"首次分析时间: {website['first_analyzed_at']}\n",
+                f"最后更新时间: {website['last_updated_at']}"
+            ]
+        return "\n".join(response_text)
+
     def _is_valid_url(self, url: str) -> bool:
         """验证URL是否有效"""
-        try:
-            result = urlparse(url)
-            return all([result.scheme, result.netloc])
-        except:
-            return False
\ No newline at end of file
+        # fullmatch 不会像 $ 那样放过末尾的换行符
+        return _URL_RE.fullmatch(url) is not None
\ No newline at end of file
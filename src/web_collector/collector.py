@@ -1,11 +1,231 @@
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, field
 from datetime import datetime
 from typing import Dict, List, Optional
 import asyncio
-from playwright.async_api import async_playwright, Page, TimeoutError
+import sys
+from playwright.async_api import async_playwright, Browser, Page, Playwright, Route, TimeoutError
 from bs4 import BeautifulSoup
-import json
 import logging
+from . import serialization
+
+if sys.version_info >= (3, 11):
+    from asyncio import timeout as async_timeout
+else:
+    from async_timeout import timeout as async_timeout
+
+# 页面端脚本。每段都是独立的箭头函数，既可以单独执行，也可以组合进同一次 evaluate 调用
+
+# DOM 结构以先序编码返回：标签表 + 每个节点的标签编号和子元素数量，
+# 比嵌套对象小得多，并且用显式栈遍历，不会在很深的页面上爆栈。
+# 节点数和深度设有上限，避免无限滚动等超大页面产生过大的返回数据；
+# 超过深度上限的节点记为没有子元素，超过节点上限时直接停止，truncated 标记是否截断
+_DOM_STRUCTURE_JS = '''() => {
+    const MAX_NODES = 10000;
+    const MAX_DEPTH = 64;
+    const tagTable = [];
+    const tagIds = new Map();
+    const tags = [];
+    const childCounts = [];
+    let truncated = false;
+    const stack = document.body ? [[document.body, 0]] : [];
+    while (stack.length) {
+        if (tags.length >= MAX_NODES) {
+            truncated = true;
+            break;
+        }
+        const [node, depth] = stack.pop();
+        const tag = node.tagName?.toLowerCase();
+        let id = tagIds.get(tag);
+        if (id === undefined) {
+            id = tagTable.length;
+            tagIds.set(tag, id);
+            tagTable.push(tag);
+        }
+        tags.push(id);
+        const children = node.children;
+        if (depth >= MAX_DEPTH) {
+            if (children.length) truncated = true;
+            childCounts.push(0);
+            continue;
+        }
+        childCounts.push(children.length);
+        for (let i = children.length - 1; i >= 0; i--) {
+            stack.push([children[i], depth + 1]);
+        }
+    }
+    return {tagTable, tags, childCounts, truncated};
+}'''
+
+# 按探测表检测 JavaScript 库：global 为 window 上的对象路径，selector 为 CSS 选择器，
+# version 为可选的版本号路径
+_JS_LIBRARIES_JS = '''(probes) => {
+    const lookup = path => path.split('.').reduce((obj, key) => obj?.[key], window);
+    const libraries = [];
+    for (const probe of probes) {
+        try {
+            const found = probe.global
+                ? lookup(probe.global)
+                : document.querySelector(probe.selector);
+            if (!found) continue;
+            const version = probe.version ? lookup(probe.version) : undefined;
+            libraries.push(typeof version === 'string' && version
+                ? `${probe.name} ${version}`
+                : probe.name);
+        } catch {}
+    }
+    return libraries;
+}'''
+
+_RESPONSIVE_FEATURES_JS = '''() => {
+    const meta = document.querySelector('meta[name="viewport"]');
+    const mediaQueries = Array.from(document.styleSheets)
+        .flatMap(sheet => {
+            try {
+                return Array.from(sheet.cssRules);
+            } catch {
+                return [];
+            }
+        })
+        .filter(rule => rule.type === CSSRule.MEDIA_RULE)
+        .map(rule => rule.conditionText);
+    
+    return {
+        viewport: meta?.content,
+        mediaQueries: Array.from(new Set(mediaQueries))
+    };
+}'''
+
+_PERFORMANCE_METRICS_JS = '''() => {
+    const timing = window.performance.timing;
+    const navigationStart = timing.navigationStart;
+    
+    return {
+        loadTime: timing.loadEventEnd - navigationStart,
+        domContentLoaded: timing.domContentLoadedEventEnd - navigationStart,
+        firstPaint: timing.responseStart - navigationStart,
+        resourceCount: performance.getEntriesByType('resource').length
+    };
+}'''
+
+# 只遍历一次全部元素，同时收集类名、颜色和字体。
+# 颜色和字体优先取自样式规则和内联样式，规则数远少于元素数；
+# 存在无法读取规则的跨域样式表时，回退为逐元素 getComputedStyle
+_PAGE_STYLES_JS = '''() => {
+    const classes = new Set();
+    const colors = new Set();
+    const fonts = new Set();
+    const addStyle = style => {
+        if (style.color) colors.add(style.color);
+        if (style.backgroundColor) colors.add(style.backgroundColor);
+        if (style.fontFamily) fonts.add(style.fontFamily);
+    };
+
+    let rulesReadable = true;
+    const visitRules = rules => {
+        for (const rule of rules) {
+            if (rule.style) addStyle(rule.style);
+            if (rule.cssRules) visitRules(rule.cssRules);
+            if (rule.styleSheet) visitRules(rule.styleSheet.cssRules);
+        }
+    };
+    for (const sheet of document.styleSheets) {
+        try {
+            visitRules(sheet.cssRules);
+        } catch {
+            rulesReadable = false;
+        }
+    }
+    if (!rulesReadable) {
+        colors.clear();
+        fonts.clear();
+    }
+
+    // 回退时同标签同类名的元素计算样式几乎总是相同，每种组合只计算第一个元素
+    const seenSignatures = new Set();
+    document.querySelectorAll('*').forEach(el => {
+        el.classList.forEach(cls => classes.add(cls));
+        if (!rulesReadable) {
+            const signature = el.tagName + '|' + (el.getAttribute('class') || '');
+            if (!seenSignatures.has(signature)) {
+                seenSignatures.add(signature);
+                addStyle(window.getComputedStyle(el));
+            }
+        } else if (el.style?.length) {
+            addStyle(el.style);
+        }
+    });
+    return {
+        cssClasses: Array.from(classes),
+        colors: Array.from(colors).filter(c => c !== 'rgba(0, 0, 0, 0)' && c !== 'transparent'),
+        fonts: Array.from(fonts)
+    };
+}'''
+
+# 一次 evaluate 往返收集全部特征
+_ALL_FEATURES_JS = f'''(jsLibraryProbes) => {{
+    const styles = ({_PAGE_STYLES_JS})();
+    return {{
+        dom_structure: ({_DOM_STRUCTURE_JS})(),
+        css_classes: styles.cssClasses,
+        js_libraries: ({_JS_LIBRARIES_JS})(jsLibraryProbes),
+        responsive_features: ({_RESPONSIVE_FEATURES_JS})(),
+        color_scheme: styles.colors,
+        fonts: styles.fonts,
+        performance_metrics: ({_PERFORMANCE_METRICS_JS})()
+    }};
+}}'''
+
+# 无头分析用不到 GPU 和扩展；容器中 /dev/shm 往往很小，改用临时目录避免渲染进程崩溃
+_BROWSER_ARGS = ["--disable-dev-shm-usage", "--disable-gpu", "--disable-extensions"]
+
+# 特征提取用不到图片、字体和音视频，拦截这些请求可以更快加载完页面；
+# 样式表需要保留，响应式特征和颜色、字体都从 document.styleSheets 中读取
+_BLOCKED_RESOURCE_TYPES = frozenset({"image", "font", "media"})
+
+# 特征收集超时后逐项回退收集的总时限（秒），回退过程要排在仍在运行的超时脚本之后，须单独限时
+_PARTIAL_FEATURES_TIMEOUT = 10
+
+async def _block_heavy_resources(route: Route):
+    """中止特征提取不需要的资源请求"""
+    if route.request.resource_type in _BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+# 默认检测的 JavaScript 库，可通过 WebCollector(js_library_probes=...) 或配置项
+# collector.js_libraries 替换
+DEFAULT_JS_LIBRARY_PROBES: List[Dict[str, str]] = [
+    {"name": "jQuery", "global": "jQuery", "version": "jQuery.fn.jquery"},
+    {"name": "React", "global": "React", "version": "React.version"},
+    {"name": "Vue", "global": "Vue", "version": "Vue.version"},
+    {"name": "AngularJS", "global": "angular", "version": "angular.version.full"},
+    {"name": "Angular", "selector": "[ng-version]"},
+    {"name": "Next.js", "global": "__NEXT_DATA__"},
+    {"name": "Nuxt", "global": "__NUXT__"},
+    {"name": "Svelte", "selector": "[class*='svelte-']"},
+]
+
+def _decode_dom_structure(encoded: dict) -> dict:
+    """把 _DOM_STRUCTURE_JS 返回的先序编码还原为嵌套的 DOM 结构"""
+    tag_table = encoded['tagTable']
+    tags = encoded['tags']
+    child_counts = encoded['childCounts']
+    if not tags:
+        return {"tag": "body", "children": []}
+
+    root = {"tag": tag_table[tags[0]], "children": []}
+    # 尚未收齐子节点的祖先: [节点, 剩余子节点数]
+    pending = [[root, child_counts[0]]]
+    for i in range(1, len(tags)):
+        while pending[-1][1] == 0:
+            pending.pop()
+        parent = pending[-1]
+        parent[1] -= 1
+        node = {"tag": tag_table[tags[i]], "children": []}
+        parent[0]["children"].append(node)
+        if child_counts[i]:
+            pending.append([node, child_counts[i]])
+    return root
 
 @dataclass
 class WebsiteFeatures:
@@ -20,31 +240,100 @@ class WebsiteFeatures:
     performance_metrics: dict
     created_at: datetime
     updated_at: datetime
+    # SimilarityAnalyzer 提取的中间结果缓存，只由上面的特征决定，不参与序列化和比较
+    _similarity_profile: Optional[dict] = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
     def to_dict(self) -> dict:
-        """转换为字典"""
-        data = asdict(self)
-        data['created_at'] = self.created_at.isoformat()
-        data['updated_at'] = self.updated_at.isoformat()
-        return data
+        """转换为字典，直接引用各字段而不像 asdict 那样递归深拷贝 DOM 结构"""
+        return {
+            'url': self.url,
+            'dom_structure': self.dom_structure,
+            'css_classes': self.css_classes,
+            'js_libraries': self.js_libraries,
+            'responsive_features': self.responsive_features,
+            'color_scheme': self.color_scheme,
+            'fonts': self.fonts,
+            'performance_metrics': self.performance_metrics,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
 
     def to_json(self) -> str:
         """转换为JSON字符串"""
-        return json.dumps(self.to_dict())
+        return serialization.dumps(self.to_dict())
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'WebsiteFeatures':
+        """从 to_dict 的结果重建特征对象"""
+        return cls(**{
+            **data,
+            'created_at': datetime.fromisoformat(data['created_at']),
+            'updated_at': datetime.fromisoformat(data['updated_at'])
+        })
 
 class WebCollector:
     """网站数据收集器"""
     
-    def __init__(self, timeout: int = 120):
+    def __init__(self, timeout: int = 120, js_library_probes: Optional[List[Dict[str, str]]] = None):
         self.timeout = timeout
+        self.js_library_probes = js_library_probes or DEFAULT_JS_LIBRARY_PROBES
         self.logger = logging.getLogger(__name__)
+        self._playwright: Optional[Playwright] = None
+        self._browser: Optional[Browser] = None
+        # 浏览器崩溃或断开后由第一个发现的协程重新启动，其余协程等待
+        self._browser_lock = asyncio.Lock()
+
+    @property
+    def browser(self) -> Browser:
+        """获取共享的浏览器实例"""
+        if self._browser is None:
+            raise RuntimeError("浏览器尚未启动")
+        return self._browser
+
+    async def _connected_browser(self) -> Browser:
+        """获取可用的浏览器实例，浏览器崩溃或断开（OOM、渲染进程被杀等）时重新启动"""
+        browser = self.browser
+        if browser.is_connected():
+            return browser
+        async with self._browser_lock:
+            if self._browser is not None and not self._browser.is_connected():
+                self.logger.warning("浏览器已断开，正在重新启动")
+                self._browser = await self._playwright.chromium.launch(args=_BROWSER_ARGS)
+            return self.browser
+
+    async def start(self):
+        """启动共享的浏览器实例，避免每次分析都重新启动 Chromium"""
+        if self._browser is None:
+            self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch(args=_BROWSER_ARGS)
+
+    async def stop(self):
+        """关闭浏览器实例"""
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def __aenter__(self) -> 'WebCollector':
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.stop()
 
     async def analyze_url(self, url: str) -> Optional[WebsiteFeatures]:
         """分析网站URL并提取特征"""
         try:
-            async with async_playwright() as p:
-                browser = await p.chromium.launch()
-                page = await browser.new_page()
+            # 每个URL使用独立的浏览器上下文，彼此隔离但无需重新启动浏览器
+            browser = await self._connected_browser()
+            context = await browser.new_context()
+            try:
+                await context.route("**/*", _block_heavy_resources)
+                page = await context.new_page()
                 
                 # 设置基本超时
                 page.set_default_timeout(self.timeout * 1000)
@@ -57,72 +346,88 @@ class WebCollector:
                     self.logger.warning(f"页面加载超时，将基于已加载内容进行分析: {url}")
                 
                 try:
-                    # 收集特征，使用asyncio.wait_for来处理超时
-                    features = await asyncio.wait_for(
-                        self._collect_features(page, url),
-                        timeout=max(5, self.timeout - 30)  # 留出一些时间给清理工作
-                    )
+                    # 收集特征并限制耗时，留出一些时间给清理工作
+                    async with async_timeout(max(5, self.timeout - 30)):
+                        features = await self._collect_features(page, url)
                 except asyncio.TimeoutError:
                     self.logger.warning("特征收集超时，使用已获取的数据")
                     # 使用已获取的部分数据创建特征对象
                     features = await self._collect_partial_features(page, url)
                 
-                await browser.close()
                 return features
+            finally:
+                await context.close()
                 
         except Exception as e:
             self.logger.error(f"分析URL时出错: {url}, 错误: {str(e)}")
             return None
 
+    async def analyze_urls(self, urls: List[str], concurrency: int = 4) -> List[Optional[WebsiteFeatures]]:
+        """并发分析多个URL，结果顺序与输入一致，分析失败的为 None"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def analyze(url: str) -> Optional[WebsiteFeatures]:
+            async with semaphore:
+                return await self.analyze_url(url)
+
+        return await asyncio.gather(*(analyze(url) for url in urls))
+
     async def _collect_partial_features(self, page: Page, url: str) -> WebsiteFeatures:
         """收集部分页面特征（用于超时情况）"""
-        try:
-            # 获取当前可用的DOM结构
-            dom_structure = await self._analyze_dom_structure(page)
-        except Exception:
-            dom_structure = {"tag": "body", "children": []}
+        # 超时的一次性收集脚本仍在页面中运行，之后的 evaluate 无论是否拆分都要排在它后面。
+        # 逐项收集与一次性收集的总工作量相同（不重复遍历），好处是每项结果一到就保留，
+        # 整个回退过程单独限时，到时未完成的项使用默认值；开销小的项放在前面
+        dom_structure = {"tag": "body", "children": []}
+        css_classes = []
+        js_libraries = []
+        responsive_features = {"viewport": None, "mediaQueries": []}
+        color_scheme = []
+        fonts = []
+        performance_metrics = {
+            "loadTime": 0,
+            "domContentLoaded": 0,
+            "firstPaint": 0,
+            "resourceCount": 0
+        }
 
         try:
-            # 获取可见的CSS类
-            css_classes = await self._extract_css_classes(page)
-        except Exception:
-            css_classes = []
-
-        try:
-            # 检测已加载的JS库
-            js_libraries = await self._detect_js_libraries(page)
-        except Exception:
-            js_libraries = []
+            async with async_timeout(_PARTIAL_FEATURES_TIMEOUT):
+                try:
+                    # 获取性能指标
+                    performance_metrics = await self._collect_performance_metrics(page)
+                except Exception:
+                    pass
 
-        try:
-            # 获取响应式特征
-            responsive_features = await self._analyze_responsive_features(page)
-        except Exception:
-            responsive_features = {"viewport": None, "mediaQueries": []}
+                try:
+                    # 获取响应式特征
+                    responsive_features = await self._analyze_responsive_features(page)
+                except Exception:
+                    pass
 
-        try:
-            # 获取颜色方案
-            color_scheme = await self._extract_color_scheme(page)
-        except Exception:
-            color_scheme = []
+                try:
+                    # 检测已加载的JS库
+                    js_libraries = await self._detect_js_libraries(page)
+                except Exception:
+                    pass
 
-        try:
-            # 获取字体信息
-            fonts = await self._extract_fonts(page)
-        except Exception:
-            fonts = []
+                try:
+                    # 获取当前可用的DOM结构
+                    dom_structure = await self._analyze_dom_structure(page)
+                except Exception:
+                    pass
 
-        try:
-            # 获取性能指标
-            performance_metrics = await self._collect_performance_metrics(page)
-        except Exception:
-            performance_metrics = {
-                "loadTime": 0,
-                "domContentLoaded": 0,
-                "firstPaint": 0,
-                "resourceCount": 0
-            }
+                try:
+                    # CSS类、颜色方案和字体来自同一次元素和样式遍历
+                    styles = await self._extract_page_styles(page)
+                    css_classes = styles['cssClasses']
+                    color_scheme = styles['colors']
+                    fonts = styles['fonts']
+                except Exception:
+                    pass
+        except asyncio.TimeoutError:
+            self.logger.warning("逐项收集特征超时，其余特征使用默认值")
 
+        now = datetime.now()
         return WebsiteFeatures(
             url=url,
             dom_structure=dom_structure,
@@ -132,150 +437,54 @@ class WebCollector:
             color_scheme=color_scheme,
             fonts=fonts,
             performance_metrics=performance_metrics,
-            created_at=datetime.now(),
-            updated_at=datetime.now()
+            created_at=now,
+            updated_at=now
         )
 
     async def _analyze_dom_structure(self, page: Page) -> dict:
         """分析DOM结构"""
-        dom_structure = await page.evaluate('''() => {
-            function getNodeStructure(node) {
-                const result = {
-                    tag: node.tagName?.toLowerCase(),
-                    children: []
-                };
-                
-                for (const child of node.children) {
-                    result.children.push(getNodeStructure(child));
-                }
-                
-                return result;
-            }
-            return getNodeStructure(document.body);
-        }''')
-        return dom_structure
-
-    async def _extract_css_classes(self, page: Page) -> List[str]:
-        """提取CSS类名"""
-        classes = await page.evaluate('''() => {
-            const classes = new Set();
-            document.querySelectorAll('*').forEach(el => {
-                el.classList.forEach(cls => classes.add(cls));
-            });
-            return Array.from(classes);
-        }''')
-        return classes
+        dom_structure = await page.evaluate(_DOM_STRUCTURE_JS)
+        return _decode_dom_structure(dom_structure)
 
     async def _detect_js_libraries(self, page: Page) -> List[str]:
         """检测JavaScript库"""
-        libraries = await page.evaluate('''() => {
-            const libraries = [];
-            if (window.jQuery) libraries.push('jQuery');
-            if (window.React) libraries.push('React');
-            if (window.Vue) libraries.push('Vue');
-            if (window.Angular) libraries.push('Angular');
-            return libraries;
-        }''')
+        libraries = await page.evaluate(_JS_LIBRARIES_JS, self.js_library_probes)
         return libraries
 
     async def _analyze_responsive_features(self, page: Page) -> dict:
         """分析响应式设计特征"""
-        features = await page.evaluate('''() => {
-            const meta = document.querySelector('meta[name="viewport"]');
-            const mediaQueries = Array.from(document.styleSheets)
-                .flatMap(sheet => {
-                    try {
-                        return Array.from(sheet.cssRules);
-                    } catch {
-                        return [];
-                    }
-                })
-                .filter(rule => rule.type === CSSRule.MEDIA_RULE)
-                .map(rule => rule.conditionText);
-            
-            return {
-                viewport: meta?.content,
-                mediaQueries: Array.from(new Set(mediaQueries))
-            };
-        }''')
+        features = await page.evaluate(_RESPONSIVE_FEATURES_JS)
         return features
 
-    async def _extract_color_scheme(self, page: Page) -> List[str]:
-        """提取颜色方案"""
-        colors = await page.evaluate('''() => {
-            const colors = new Set();
-            const elements = document.querySelectorAll('*');
-            elements.forEach(el => {
-                const style = window.getComputedStyle(el);
-                colors.add(style.color);
-                colors.add(style.backgroundColor);
-            });
-            return Array.from(colors).filter(c => c !== 'rgba(0, 0, 0, 0)');
-        }''')
-        return colors
-
-    async def _extract_fonts(self, page: Page) -> List[str]:
-        """提取字体信息"""
-        fonts = await page.evaluate('''() => {
-            const fonts = new Set();
-            document.querySelectorAll('*').forEach(el => {
-                const fontFamily = window.getComputedStyle(el).fontFamily;
-                fonts.add(fontFamily);
-            });
-            return Array.from(fonts);
-        }''')
-        return fonts
+    async def _extract_page_styles(self, page: Page) -> dict:
+        """一次遍历提取类名、颜色方案和字体信息"""
+        styles = await page.evaluate(_PAGE_STYLES_JS)
+        return styles
 
     async def _collect_performance_metrics(self, page: Page) -> dict:
         """收集性能指标"""
-        metrics = await page.evaluate('''() => {
-            const timing = window.performance.timing;
-            const navigationStart = timing.navigationStart;
-            
-            return {
-                loadTime: timing.loadEventEnd - navigationStart,
-                domContentLoaded: timing.domContentLoadedEventEnd - navigationStart,
-                firstPaint: timing.responseStart - navigationStart,
-                resourceCount: performance.getEntriesByType('resource').length
-            };
-        }''')
+        metrics = await page.evaluate(_PERFORMANCE_METRICS_JS)
         return metrics
 
+    async def _collect_all_in_one(self, page: Page) -> dict:
+        """单次 evaluate 往返收集全部特征，只遍历一次全部元素"""
+        features = await page.evaluate(_ALL_FEATURES_JS, self.js_library_probes)
+        if features['dom_structure'].get('truncated'):
+            self.logger.info("DOM 节点过多或层级过深，结构已截断")
+        features['dom_structure'] = _decode_dom_structure(features['dom_structure'])
+        return features
+
     async def _collect_features(self, page: Page, url: str) -> WebsiteFeatures:
         """收集页面特征"""
         try:
-            # 获取当前可用的DOM结构
-            dom_structure = await self._analyze_dom_structure(page)
-            
-            # 获取可见的CSS类
-            css_classes = await self._extract_css_classes(page)
-            
-            # 检测已加载的JS库
-            js_libraries = await self._detect_js_libraries(page)
-            
-            # 获取响应式特征
-            responsive_features = await self._analyze_responsive_features(page)
-            
-            # 获取颜色方案
-            color_scheme = await self._extract_color_scheme(page)
-            
-            # 获取字体信息
-            fonts = await self._extract_fonts(page)
-            
-            # 获取性能指标
-            performance_metrics = await self._collect_performance_metrics(page)
+            features = await self._collect_all_in_one(page)
 
+            now = datetime.now()
             return WebsiteFeatures(
                 url=url,
-                dom_structure=dom_structure,
-                css_classes=css_classes,
-                js_libraries=js_libraries,
-                responsive_features=responsive_features,
-                color_scheme=color_scheme,
-                fonts=fonts,
-                performance_metrics=performance_metrics,
-                created_at=datetime.now(),
-                updated_at=datetime.now()
+                **features,
+                created_at=now,
+                updated_at=now
             )
             
         except Exception as e:
@@ -1,19 +1,24 @@
-from typing import Dict
+from typing import Any, Dict
 import os
 import yaml
 
+# 有 libyaml 时使用 C 实现的加载器
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 class Config:
     """配置管理类"""
     
     def __init__(self, config_path: str = "config.yml"):
         self.config_path = config_path
         self.config = self._load_config()
+        # 以点号连接的键到值的映射，包含中间层级，get 只需一次字典查找
+        self._flat = self._flatten(self.config or {})
 
     def _load_config(self) -> Dict:
         """加载配置文件"""
         if os.path.exists(self.config_path):
             with open(self.config_path, 'r') as f:
-                return yaml.safe_load(f)
+                return yaml.load(f, Loader=_YAML_LOADER)
         return self._get_default_config()
 
     def _get_default_config(self) -> Dict:
@@ -28,7 +33,8 @@ class Config:
             },
             'collector': {
                 'timeout': 30,
-                'max_retries': 3
+                'max_retries': 3,
+                'concurrency': 4
             },
             'similarity': {
                 'threshold': 0.85
@@ -38,13 +44,16 @@ class Config:
             }
         }
 
+    def _flatten(self, config: Dict, prefix: str = '') -> Dict[str, Any]:
+        """把嵌套配置展开为 {'collector.timeout': 120, 'collector': {...}, ...}"""
+        flat = {}
+        for key, value in config.items():
+            full_key = f"{prefix}{key}"
+            flat[full_key] = value
+            if isinstance(value, dict):
+                flat.update(self._flatten(value, f"{full_key}."))
+        return flat
+
     def get(self, key: str, default=None):
         """获取配置值"""
-        try:
-            keys = key.split('.')
-            value = self.config
-            for k in keys:
-                value = value[k]
-            return value
-        except (KeyError, TypeError):
-            return default 
\ No newline at end of file
+        return self._flat.get(key, default) 
\ No newline at end of file
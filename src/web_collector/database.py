@@ -1,11 +1,20 @@
 from datetime import datetime
+import asyncio
+import sqlite3
 from typing import Optional, List, Dict, Tuple
 import aiosqlite
-import json
 import logging
 from pathlib import Path
 from .collector import WebsiteFeatures
-from urllib.parse import urlparse
+from . import serialization
+from urllib.parse import urlsplit
+
+# INSERT ... RETURNING 需要 SQLite 3.35+，Python 3.9 等环境自带的 SQLite 可能更旧
+_SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+def _url_host(url: str) -> str:
+    """取URL的域名部分，统一小写，用于按域名查找网站"""
+    return urlsplit(url).netloc.lower()
 
 class Database:
     """数据库管理类"""
@@ -13,59 +22,210 @@ class Database:
     def __init__(self, db_path: str = "website_templates.db"):
         self.db_path = db_path
         self.logger = logging.getLogger(__name__)
+        self._db: Optional[aiosqlite.Connection] = None
+        # 所有方法共用一个连接，写操作串行执行，避免不同协程的语句混进同一个事务；
+        # 结果会被缓存的读操作（get_template_features）查询时也持有此锁，避免读到未提交的数据
+        self._write_lock = asyncio.Lock()
+        # 模板特征缓存: template_id -> (代表网站ID, 特征对象)
+        self._template_cache: Dict[int, Tuple[int, WebsiteFeatures]] = {}
+
+    @property
+    def db(self) -> aiosqlite.Connection:
+        """获取共享的数据库连接"""
+        if self._db is None:
+            raise RuntimeError("数据库尚未初始化")
+        return self._db
 
     async def initialize(self):
-        """初始化数据库表"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # 创建网站记录表
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS websites (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    url TEXT UNIQUE NOT NULL,
-                    template_id INTEGER,
-                    first_analyzed_at TIMESTAMP,
-                    last_updated_at TIMESTAMP,
-                    status TEXT,
-                    features JSON,
-                    FOREIGN KEY (template_id) REFERENCES templates (id)
-                )
-            """)
-
-            # 创建模板分类表
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS templates (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    created_at TIMESTAMP,
-                    website_count INTEGER DEFAULT 0,
-                    feature_summary JSON,
-                    last_updated_at TIMESTAMP
-                )
-            """)
+        """打开数据库连接并初始化数据库表"""
+        if self._db is None:
+            self._db = await aiosqlite.connect(self.db_path)
+            # WAL 模式下读写互不阻塞，NORMAL 同步级别避免每次提交都 fsync
+            await self._db.execute("PRAGMA journal_mode=WAL")
+            await self._db.execute("PRAGMA synchronous=NORMAL")
+            # 临时表和排序放在内存中，页缓存约 64MB，并用 256MB 内存映射读取数据库文件
+            await self._db.execute("PRAGMA temp_store=MEMORY")
+            await self._db.execute("PRAGMA cache_size=-64000")
+            await self._db.execute("PRAGMA mmap_size=268435456")
+
+        db = self.db
+        # 创建网站记录表
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS websites (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT UNIQUE NOT NULL,
+                host TEXT,
+                template_id INTEGER,
+                first_analyzed_at TIMESTAMP,
+                last_updated_at TIMESTAMP,
+                status TEXT,
+                features JSON,
+                FOREIGN KEY (template_id) REFERENCES templates (id)
+            )
+        """)
+
+        # 创建模板分类表
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS templates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at TIMESTAMP,
+                website_count INTEGER DEFAULT 0,
+                feature_summary JSON,
+                last_updated_at TIMESTAMP
+            )
+        """)
+
+        # 分组列表按模板取网站并按首次分析时间排序，索引可省去全表扫描和排序
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_websites_template_first_analyzed
+            ON websites (template_id, first_analyzed_at)
+        """)
+        # 最近网站列表和旧记录清理按最后更新时间排序/过滤
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_websites_last_updated
+            ON websites (last_updated_at)
+        """)
+
+        # 旧版本的数据库没有 host 列，补上该列并回填已有记录
+        async with db.execute("PRAGMA table_info(websites)") as cursor:
+            columns = {row[1] async for row in cursor}
+        if 'host' not in columns:
+            await db.execute("ALTER TABLE websites ADD COLUMN host TEXT")
+            async with db.execute("SELECT id, url FROM websites") as cursor:
+                hosts = [(_url_host(url), website_id) async for website_id, url in cursor]
+            await db.executemany("UPDATE websites SET host = ? WHERE id = ?", hosts)
+        # 按域名查找已分析过的网站
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_websites_host
+            ON websites (host)
+        """)
             
-            await db.commit()
+        await db.commit()
+
+    async def close(self):
+        """关闭数据库连接"""
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
 
     async def add_website(self, url: str, features: WebsiteFeatures) -> int:
         """添加新的网站记录"""
-        try:
-            async with aiosqlite.connect(self.db_path) as db:
+        db = self.db
+        async with self._write_lock:
+            try:
                 now = datetime.now()
                 cursor = await db.execute(
                     """
-                    INSERT INTO websites (url, first_analyzed_at, last_updated_at, status, features)
-                    VALUES (?, ?, ?, ?, ?)
+                    INSERT INTO websites (url, host, first_analyzed_at, last_updated_at, status, features)
+                    VALUES (?, ?, ?, ?, ?, ?)
                     """,
-                    (url, now, now, "analyzed", json.dumps(features.to_dict()))
+                    (url, _url_host(url), now, now, "analyzed", features.to_json())
                 )
                 await db.commit()
                 return cursor.lastrowid
-        except Exception as e:
-            self.logger.error(f"添加网站记录失败: {str(e)}")
-            raise
+            except Exception as e:
+                await db.rollback()
+                self.logger.error(f"添加网站记录失败: {str(e)}")
+                raise
+
+    async def add_websites_bulk(self, items: List[Tuple[str, WebsiteFeatures]]) -> List[int]:
+        """在同一个事务中批量添加网站记录，返回与输入顺序一致的网站ID"""
+        if not items:
+            return []
+        db = self.db
+        async with self._write_lock:
+            try:
+                now = datetime.now()
+                await db.executemany(
+                    """
+                    INSERT INTO websites (url, host, first_analyzed_at, last_updated_at, status, features)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    [
+                        (url, _url_host(url), now, now, "analyzed", features.to_json())
+                        for url, features in items
+                    ]
+                )
+
+                # executemany 不返回每行的ID，按URL查回
+                urls = [url for url, _ in items]
+                ids: Dict[str, int] = {}
+                for i in range(0, len(urls), 500):
+                    batch = urls[i:i + 500]
+                    placeholders = ", ".join("?" * len(batch))
+                    async with db.execute(
+                        f"SELECT url, id FROM websites WHERE url IN ({placeholders})",
+                        batch
+                    ) as cursor:
+                        async for url, website_id in cursor:
+                            ids[url] = website_id
+
+                await db.commit()
+                return [ids[url] for url in urls]
+            except Exception as e:
+                await db.rollback()
+                self.logger.error(f"批量添加网站记录失败: {str(e)}")
+                raise
+
+    async def save_website(self, url: str, features: WebsiteFeatures,
+                           template_id: Optional[int] = None) -> Tuple[int, int]:
+        """在同一个事务中保存网站并归入模板，返回 (网站ID, 模板ID)
+
+        指定 template_id 时归入该模板并更新其网站数量，否则以该网站创建新模板。
+        """
+        db = self.db
+        async with self._write_lock:
+            try:
+                now = datetime.now()
+                features_json = features.to_json()
+                cursor = await db.execute(
+                    """
+                    INSERT INTO websites (url, host, template_id, first_analyzed_at, last_updated_at, status, features)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (url, _url_host(url), template_id, now, now, "analyzed", features_json)
+                )
+                website_id = cursor.lastrowid
+
+                if template_id is None:
+                    cursor = await db.execute(
+                        """
+                        INSERT INTO templates (created_at, website_count, feature_summary, last_updated_at)
+                        VALUES (?, 1, ?, ?)
+                        """,
+                        (now, features_json, now)
+                    )
+                    template_id = cursor.lastrowid
+                    await db.execute(
+                        "UPDATE websites SET template_id = ? WHERE id = ?",
+                        (template_id, website_id)
+                    )
+                else:
+                    # 与 update_template_count 一样按实际网站数重新统计，避免计数漂移
+                    await db.execute(
+                        """
+                        UPDATE templates
+                        SET website_count = (
+                                SELECT COUNT(*) FROM websites WHERE template_id = templates.id
+                            ),
+                            last_updated_at = ?
+                        WHERE id = ?
+                        """,
+                        (now, template_id)
+                    )
+
+                await db.commit()
+                return website_id, template_id
+            except Exception as e:
+                await db.rollback()
+                self.logger.error(f"保存网站记录失败: {str(e)}")
+                raise
 
     async def update_website_template(self, website_id: int, template_id: int):
         """更新网站的模板ID"""
-        try:
-            async with aiosqlite.connect(self.db_path) as db:
+        db = self.db
+        async with self._write_lock:
+            try:
                 await db.execute(
                     """
                     UPDATE websites 
@@ -75,39 +235,41 @@ class Database:
                     (template_id, datetime.now(), website_id)
                 )
                 await db.commit()
-        except Exception as e:
-            self.logger.error(f"更新网站模板失败: {str(e)}")
-            raise
+            except Exception as e:
+                await db.rollback()
+                self.logger.error(f"更新网站模板失败: {str(e)}")
+                raise
 
     async def create_template(self, feature_summary: dict) -> int:
         """创建新的模板记录"""
-        try:
-            async with aiosqlite.connect(self.db_path) as db:
+        db = self.db
+        async with self._write_lock:
+            try:
                 now = datetime.now()
                 cursor = await db.execute(
                     """
                     INSERT INTO templates (created_at, website_count, feature_summary, last_updated_at)
                     VALUES (?, ?, ?, ?)
                     """,
-                    (now, 1, json.dumps(feature_summary), now)
+                    (now, 1, serialization.dumps(feature_summary), now)
                 )
                 await db.commit()
                 return cursor.lastrowid
-        except Exception as e:
-            self.logger.error(f"创建模板失败: {str(e)}")
-            raise
+            except Exception as e:
+                await db.rollback()
+                self.logger.error(f"创建模板失败: {str(e)}")
+                raise
 
     async def get_website_features(self, url: str) -> Optional[dict]:
         """获取网站特征"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                db.row_factory = aiosqlite.Row
-                async with db.execute(
-                    "SELECT features FROM websites WHERE url = ?",
-                    (url,)
-                ) as cursor:
-                    row = await cursor.fetchone()
-                    return json.loads(row['features']) if row else None
+            db = self.db
+            async with db.execute(
+                "SELECT features FROM websites WHERE url = ?",
+                (url,)
+            ) as cursor:
+                row = await cursor.fetchone()
+                return serialization.loads(row[0]) if row else None
         except Exception as e:
             self.logger.error(f"获取网站特征失败: {str(e)}")
             return None
@@ -115,18 +277,18 @@ class Database:
     async def get_template_websites(self, template_id: int) -> List[Dict]:
         """获取使用特定模板的所有网站"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                db.row_factory = aiosqlite.Row
-                async with db.execute(
-                    """
-                    SELECT url, first_analyzed_at, last_updated_at
-                    FROM websites
-                    WHERE template_id = ?
-                    """,
-                    (template_id,)
-                ) as cursor:
-                    rows = await cursor.fetchall()
-                    return [dict(row) for row in rows]
+            db = self.db
+            async with db.execute(
+                """
+                SELECT url, first_analyzed_at, last_updated_at
+                FROM websites
+                WHERE template_id = ?
+                """,
+                (template_id,)
+            ) as cursor:
+                cursor.row_factory = aiosqlite.Row
+                rows = await cursor.fetchall()
+                return [dict(row) for row in rows]
         except Exception as e:
             self.logger.error(f"获取模板网站失败: {str(e)}")
             return []
@@ -134,32 +296,30 @@ class Database:
     async def get_statistics(self) -> Dict:
         """获取统计信息"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                # 获取网站总数
-                async with db.execute("SELECT COUNT(*) FROM websites") as cursor:
-                    total_websites = (await cursor.fetchone())[0]
+            db = self.db
+            # 一次查询同时获取网站总数和模板总数，结果为普通元组
+            async with db.execute(
+                "SELECT (SELECT COUNT(*) FROM websites), (SELECT COUNT(*) FROM templates)"
+            ) as cursor:
+                total_websites, total_templates = await cursor.fetchone()
 
-                # 获取模板总数
-                async with db.execute("SELECT COUNT(*) FROM templates") as cursor:
-                    total_templates = (await cursor.fetchone())[0]
-
-                # 获取最近分析的网站
-                db.row_factory = aiosqlite.Row
-                async with db.execute(
-                    """
-                    SELECT url, last_updated_at 
-                    FROM websites 
-                    ORDER BY last_updated_at DESC 
-                    LIMIT 5
-                    """
-                ) as cursor:
-                    recent_websites = [dict(row) for row in await cursor.fetchall()]
+            # 获取最近分析的网站
+            async with db.execute(
+                """
+                SELECT url, last_updated_at 
+                FROM websites 
+                ORDER BY last_updated_at DESC 
+                LIMIT 5
+                """
+            ) as cursor:
+                cursor.row_factory = aiosqlite.Row
+                recent_websites = [dict(row) for row in await cursor.fetchall()]
 
-                return {
-                    "total_websites": total_websites,
-                    "total_templates": total_templates,
-                    "recent_websites": recent_websites
-                }
+            return {
+                "total_websites": total_websites,
+                "total_templates": total_templates,
+                "recent_websites": recent_websites
+            }
         except Exception as e:
             self.logger.error(f"获取统计信息失败: {str(e)}")
             return {
@@ -170,8 +330,9 @@ class Database:
 
     async def cleanup_old_records(self, days: int = 30):
         """清理超过指定天数的旧记录"""
-        try:
-            async with aiosqlite.connect(self.db_path) as db:
+        db = self.db
+        async with self._write_lock:
+            try:
                 await db.execute(
                     """
                     DELETE FROM websites 
@@ -180,82 +341,144 @@ class Database:
                     (f'-{days} days',)
                 )
                 await db.commit()
-        except Exception as e:
-            self.logger.error(f"清理旧记录失败: {str(e)}")
+            except Exception as e:
+                await db.rollback()
+                self.logger.error(f"清理旧记录失败: {str(e)}")
 
     async def get_all_templates(self) -> List[Tuple[int, Dict]]:
         """获取所有模板及其特征"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                db.row_factory = aiosqlite.Row
+            db = self.db
+            async with db.execute(
+                """
+                SELECT t.id, w.features
+                FROM templates t
+                JOIN websites w ON w.template_id = t.id
+                WHERE w.id IN (
+                    SELECT MIN(id)
+                    FROM websites
+                    WHERE template_id IS NOT NULL
+                    GROUP BY template_id
+                )
+                """
+            ) as cursor:
+                templates = await cursor.fetchall()
+                return [
+                    (template_id, serialization.loads(features)) for template_id, features in templates
+                ]
+        except Exception as e:
+            self.logger.error(f"获取模板失败: {str(e)}")
+            return []
+
+    async def get_template_features(self) -> List[Tuple[int, WebsiteFeatures]]:
+        """获取所有模板及其特征对象
+
+        模板特征取自该模板下ID最小的网站。特征对象按 (模板ID, 代表网站ID) 缓存，
+        只有新增的模板或代表网站发生变化（例如被清理）时才重新读取和解析。
+        查询在写锁内进行，不会读到其他协程尚未提交、之后可能回滚的记录；
+        解析 JSON 在锁外进行，不阻塞写操作。
+        """
+        try:
+            db = self.db
+            cache = self._template_cache
+            async with self._write_lock:
                 async with db.execute(
                     """
-                    SELECT t.id, w.features
+                    SELECT t.id, MIN(w.id)
                     FROM templates t
                     JOIN websites w ON w.template_id = t.id
-                    WHERE w.id IN (
-                        SELECT MIN(id)
-                        FROM websites
-                        WHERE template_id IS NOT NULL
-                        GROUP BY template_id
-                    )
+                    GROUP BY t.id
                     """
                 ) as cursor:
-                    templates = await cursor.fetchall()
-                    return [(t['id'], json.loads(t['features'])) for t in templates]
+                    representatives = await cursor.fetchall()
+
+                misses = {
+                    website_id: template_id
+                    for template_id, website_id in representatives
+                    if cache.get(template_id, (None,))[0] != website_id
+                }
+                rows = []
+                website_ids = list(misses)
+                for i in range(0, len(website_ids), 500):
+                    batch = website_ids[i:i + 500]
+                    placeholders = ", ".join("?" * len(batch))
+                    async with db.execute(
+                        f"SELECT id, features FROM websites WHERE id IN ({placeholders})",
+                        batch
+                    ) as cursor:
+                        rows.extend(await cursor.fetchall())
+
+            for website_id, features in rows:
+                cache[misses[website_id]] = (
+                    website_id, WebsiteFeatures.from_dict(serialization.loads(features))
+                )
+
+            # 丢弃已不存在的模板
+            current = {template_id for template_id, _ in representatives}
+            for template_id in cache.keys() - current:
+                del cache[template_id]
+
+            return [
+                (template_id, cache[template_id][1])
+                for template_id, _ in representatives
+                if template_id in cache
+            ]
         except Exception as e:
             self.logger.error(f"获取模板失败: {str(e)}")
             return []
 
     async def update_template_count(self, template_id: int):
         """更新模板的网站数量"""
-        try:
-            async with aiosqlite.connect(self.db_path) as db:
-                # 获取该模板的网站数量
-                async with db.execute(
-                    "SELECT COUNT(*) FROM websites WHERE template_id = ?",
-                    (template_id,)
-                ) as cursor:
-                    count = (await cursor.fetchone())[0]
-
-                # 更新模板记录
+        db = self.db
+        async with self._write_lock:
+            try:
+                # 在同一条语句中统计并更新网站数量
                 await db.execute(
                     """
                     UPDATE templates 
-                    SET website_count = ?, last_updated_at = ?
+                    SET website_count = (
+                            SELECT COUNT(*) FROM websites WHERE template_id = templates.id
+                        ),
+                        last_updated_at = ?
                     WHERE id = ?
                     """,
-                    (count, datetime.now(), template_id)
+                    (datetime.now(), template_id)
                 )
                 await db.commit()
-        except Exception as e:
-            self.logger.error(f"更新模板数量失败: {str(e)}")
-            raise
+            except Exception as e:
+                await db.rollback()
+                self.logger.error(f"更新模板数量失败: {str(e)}")
+                raise
 
     async def create_template_from_website(self, website_id: int) -> int:
         """从网站创建新模板"""
-        try:
-            async with aiosqlite.connect(self.db_path) as db:
-                # 获取网站特征
-                async with db.execute(
-                    "SELECT features FROM websites WHERE id = ?",
-                    (website_id,)
-                ) as cursor:
-                    row = await cursor.fetchone()
-                    if not row:
-                        raise ValueError(f"Website {website_id} not found")
-                    features = json.loads(row[0])
-
-                # 创建新模板
+        db = self.db
+        async with self._write_lock:
+            try:
+                # 直接复制网站的特征文本创建新模板
                 now = datetime.now()
-                cursor = await db.execute(
-                    """
-                    INSERT INTO templates (created_at, website_count, feature_summary, last_updated_at)
-                    VALUES (?, 1, ?, ?)
-                    """,
-                    (now, json.dumps(features), now)
-                )
-                template_id = cursor.lastrowid
+                if _SQLITE_HAS_RETURNING:
+                    async with db.execute(
+                        """
+                        INSERT INTO templates (created_at, website_count, feature_summary, last_updated_at)
+                        SELECT ?, 1, features, ? FROM websites WHERE id = ?
+                        RETURNING id
+                        """,
+                        (now, now, website_id)
+                    ) as cursor:
+                        row = await cursor.fetchone()
+                    template_id = row[0] if row else None
+                else:
+                    cursor = await db.execute(
+                        """
+                        INSERT INTO templates (created_at, website_count, feature_summary, last_updated_at)
+                        SELECT ?, 1, features, ? FROM websites WHERE id = ?
+                        """,
+                        (now, now, website_id)
+                    )
+                    template_id = cursor.lastrowid if cursor.rowcount else None
+                if template_id is None:
+                    raise ValueError(f"Website {website_id} not found")
 
                 # 更新网站的模板ID
                 await db.execute(
@@ -264,51 +487,49 @@ class Database:
                 )
                 await db.commit()
                 return template_id
-        except Exception as e:
-            self.logger.error(f"创建模板失败: {str(e)}")
-            raise
+            except Exception as e:
+                await db.rollback()
+                self.logger.error(f"创建模板失败: {str(e)}")
+                raise
 
     async def get_grouped_websites(self) -> List[Dict]:
         """获取按模板分组的网站列表"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                db.row_factory = aiosqlite.Row
-                # 获取所有模板及其关联的网站
-                async with db.execute(
-                    """
-                    SELECT 
-                        t.id as template_id,
-                        t.website_count,
-                        t.created_at as template_created_at,
-                        w.url,
-                        w.first_analyzed_at,
-                        w.last_updated_at
-                    FROM templates t
-                    LEFT JOIN websites w ON w.template_id = t.id
-                    ORDER BY t.id, w.first_analyzed_at
-                    """
-                ) as cursor:
-                    rows = await cursor.fetchall()
-                    
-                    # 组织数据结构
-                    templates = {}
-                    for row in rows:
-                        template_id = row['template_id']
-                        if template_id not in templates:
-                            templates[template_id] = {
-                                'template_id': template_id,
-                                'website_count': row['website_count'],
-                                'created_at': row['template_created_at'],
-                                'websites': []
-                            }
-                        if row['url']:  # 确保网站URL存在
-                            templates[template_id]['websites'].append({
-                                'url': row['url'],
-                                'first_analyzed_at': row['first_analyzed_at'],
-                                'last_updated_at': row['last_updated_at']
-                            })
-                    
-                    return list(templates.values())
+            db = self.db
+            # 获取所有模板及其关联的网站
+            async with db.execute(
+                """
+                SELECT 
+                    t.id as template_id,
+                    t.website_count,
+                    t.created_at as template_created_at,
+                    w.url,
+                    w.first_analyzed_at,
+                    w.last_updated_at
+                FROM templates t
+                LEFT JOIN websites w ON w.template_id = t.id
+                ORDER BY t.id, w.first_analyzed_at
+                """
+            ) as cursor:
+                # 逐行读取游标，避免一次性把所有网站行加载到内存
+                templates = {}
+                async for (template_id, website_count, template_created_at,
+                           url, first_analyzed_at, last_updated_at) in cursor:
+                    if template_id not in templates:
+                        templates[template_id] = {
+                            'template_id': template_id,
+                            'website_count': website_count,
+                            'created_at': template_created_at,
+                            'websites': []
+                        }
+                    if url:  # 确保网站URL存在
+                        templates[template_id]['websites'].append({
+                            'url': url,
+                            'first_analyzed_at': first_analyzed_at,
+                            'last_updated_at': last_updated_at
+                        })
+                
+                return list(templates.values())
         except Exception as e:
             self.logger.error(f"获取分组网站列表失败: {str(e)}")
             return []
@@ -316,26 +537,22 @@ class Database:
     async def get_website_by_host(self, url: str) -> Optional[Dict]:
         """根据域名获取网站信息"""
         try:
-            # 解析URL获取host
-            parsed_url = urlparse(url)
-            host = parsed_url.netloc
-            
-            async with aiosqlite.connect(self.db_path) as db:
-                db.row_factory = aiosqlite.Row
-                async with db.execute(
-                    """
-                    SELECT w.*, t.id as template_id
-                    FROM websites w
-                    LEFT JOIN templates t ON w.template_id = t.id
-                    WHERE w.url LIKE ?
-                    ORDER BY w.last_updated_at DESC
-                    LIMIT 1
-                    """,
-                    (f"%{host}%",)
-                ) as cursor:
-                    row = await cursor.fetchone()
-                    if row:
-                        return dict(row)
+            db = self.db
+            async with db.execute(
+                """
+                SELECT w.*, t.id as template_id
+                FROM websites w
+                LEFT JOIN templates t ON w.template_id = t.id
+                WHERE w.host = ?
+                ORDER BY w.last_updated_at DESC
+                LIMIT 1
+                """,
+                (_url_host(url),)
+            ) as cursor:
+                cursor.row_factory = aiosqlite.Row
+                row = await cursor.fetchone()
+                if row:
+                    return dict(row)
             return None
         except Exception as e:
             self.logger.error(f"获取网站信息失败: {str(e)}")
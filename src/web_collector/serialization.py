@@ -0,0 +1,21 @@
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj: Any) -> str:
+    """序列化为JSON字符串，安装了 orjson 时使用 orjson"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """解析JSON字符串，安装了 orjson 时使用 orjson"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -1,10 +1,99 @@
-from typing import Dict, List, Tuple
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from dataclasses import asdict
+from typing import Dict, Iterable, List, Optional, Tuple
+from collections import Counter
+import re
 from .collector import WebsiteFeatures
 import logging
 
+# 参与DOM序列比较的主要布局标签
+_IMPORTANT_TAGS = frozenset({'div', 'section', 'main', 'header', 'footer', 'nav', 'aside'})
+
+# 媒体查询中的 min-width 断点
+_MIN_WIDTH_RE = re.compile(r'min-width:\s*(\d+)px')
+
+# 布局相关CSS类名包含的关键字，合并成一个正则，每个类名只需扫描一次
+_LAYOUT_KEYWORDS = ('container', 'wrapper', 'header', 'footer', 'nav', 'sidebar',
+                    'main', 'content', 'grid', 'flex', 'row', 'col', 'section')
+_LAYOUT_RE = re.compile('|'.join(map(re.escape, _LAYOUT_KEYWORDS)))
+
+# 各维度相似度的权重
+_WEIGHTS = {
+    'dom_similarity': 0.5,
+    'css_similarity': 0.3,
+    'responsive_similarity': 0.1,
+    'layout_similarity': 0.1
+}
+
+# 标签到布局类型的映射，其余标签均为 other
+_LAYOUT_TYPES = {
+    'header': 'header',
+    'footer': 'footer',
+    'nav': 'navigation',
+    'main': 'main-content',
+    'aside': 'sidebar',
+    'section': 'section',
+    'article': 'article',
+    'div': 'container'
+}
+
+def extract_layout_sequence(dom: dict) -> List[str]:
+    """提取主要布局元素的 深度:标签 序列（先序，显式栈遍历，不受递归深度限制）"""
+    sequence = []
+    append = sequence.append
+    stack = [(dom, 0)]
+    pop, push = stack.pop, stack.append
+    while stack:
+        node, depth = pop()
+        if isinstance(node, dict) and 'tag' in node:
+            tag = node['tag']
+            if tag in _IMPORTANT_TAGS:
+                append(f"{depth}:{tag}")
+            # 子节点逆序入栈，保证按原顺序出栈
+            for child in reversed(node.get('children', [])):
+                push((child, depth + 1))
+    return sequence
+
+def extract_layout_structure(dom: dict) -> List[tuple]:
+    """提取 (父布局类型, 布局类型, 子元素数量) 结构（先序，显式栈遍历）"""
+    structure = []
+    append = structure.append
+    stack = [(dom, 'root')]
+    pop, push = stack.pop, stack.append
+    while stack:
+        node, parent_type = pop()
+        if isinstance(node, dict) and 'tag' in node:
+            # 判断节点的布局类型
+            layout_type = _LAYOUT_TYPES.get((node['tag'] or '').lower(), 'other')
+            children = node.get('children', [])
+            append((parent_type, layout_type, len(children)))
+            for child in reversed(children):
+                push((child, layout_type))
+    return structure
+
+def _match_masks(seq: List[str]) -> Dict[str, int]:
+    """把序列中每个元素出现的位置编码成整数位图，供位并行LCS使用"""
+    match_masks: Dict[str, int] = {}
+    for i, item in enumerate(seq):
+        match_masks[item] = match_masks.get(item, 0) | (1 << i)
+    return match_masks
+
+def _lcs_length(seq1: List[str], seq2: List[str],
+                match_masks: Optional[Dict[str, int]] = None) -> int:
+    """位并行计算最长公共子序列长度
+
+    用 seq1 的位置位图（match_masks，可传入预先算好的结果），逐个扫描 seq2 时只做几次整数位运算，
+    相当于一次处理 DP 矩阵的一整行，避免 Python 层的双重循环和整块矩阵。
+    """
+    if match_masks is None:
+        match_masks = _match_masks(seq1)
+
+    mask = (1 << len(seq1)) - 1
+    v = mask
+    for item in seq2:
+        u = v & match_masks.get(item, 0)
+        v = ((v + u) | (v - u)) & mask
+    # v 中剩余的 0 位数即为LCS长度
+    return len(seq1) - bin(v).count('1')
+
 class SimilarityAnalyzer:
     """网站相似度分析器"""
     
@@ -14,41 +103,139 @@ class SimilarityAnalyzer:
 
     def calculate_similarity(self, site1: WebsiteFeatures, site2: WebsiteFeatures) -> float:
         """计算两个网站的总体相似度"""
-        try:
-            self.logger.info(f"\n开始比较网站相似度:")
-            self.logger.info(f"网站1: {site1.url}")
-            self.logger.info(f"网站2: {site2.url}")
-
-            weights = {
-                'dom_similarity': 0.5,
-                'css_similarity': 0.3,
-                'responsive_similarity': 0.1,
-                'layout_similarity': 0.1
-            }
+        return self._compare(site1, self._extract_profile(site1), site2, self._extract_profile(site2))
 
-            similarities = {
-                'dom_similarity': self._calculate_dom_similarity(site1.dom_structure, site2.dom_structure),
-                'css_similarity': self._calculate_css_similarity(site1.css_classes, site2.css_classes),
-                'responsive_similarity': self._calculate_responsive_similarity(
-                    site1.responsive_features, site2.responsive_features
-                ),
-                'layout_similarity': self._calculate_layout_similarity(
-                    site1.dom_structure, site2.dom_structure
-                )
+    def find_best_match(
+        self, site: WebsiteFeatures, templates: Iterable[Tuple[int, WebsiteFeatures]]
+    ) -> Tuple[Optional[int], float]:
+        """在模板中寻找与网站最相似的一个，返回 (模板ID, 相似度)
+
+        网站自身的布局序列、布局类名等只提取一次，在所有模板间复用。
+        先算出每个模板总体相似度的上界，按上界从高到低计算完整相似度，
+        上界低于阈值或当前最佳相似度时即停止。达到阈值的结果与逐个比较完全一致；
+        没有模板达到阈值时，返回的模板ID和相似度仅供参考（相似度只是下界）。
+        """
+        profile = self._extract_profile(site)
+        candidates = []
+        for index, (template_id, template) in enumerate(templates):
+            template_profile = self._extract_profile(template)
+            bounds = self._bounds(profile, template_profile)
+            upper_bound = bounds[1] + bounds[2] * _WEIGHTS['dom_similarity']
+            candidates.append((upper_bound, index, template_id, template, template_profile, bounds))
+        candidates.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+
+        best_id, best_similarity, best_index = None, 0.0, -1
+        for upper_bound, index, template_id, template, template_profile, bounds in candidates:
+            cutoff = max(self.threshold, best_similarity)
+            if upper_bound < cutoff:
+                break
+            similarity = self._compare(
+                site, profile, template, template_profile, cutoff=cutoff, bounds=bounds
+            )
+            # 相似度相同时与逐个比较一样，取排在前面的模板
+            if similarity > best_similarity or (similarity == best_similarity and index < best_index):
+                best_id, best_similarity, best_index = template_id, similarity, index
+        return best_id, best_similarity
+
+    def _extract_profile(self, site: WebsiteFeatures) -> dict:
+        """提取相似度计算所需的中间结果
+
+        结果只由网站特征决定，缓存在特征对象的 _similarity_profile 字段上，
+        同一个模板与多个网站比较时只提取一次。
+        """
+        profile = site._similarity_profile
+        if profile is None:
+            layout_sequence = extract_layout_sequence(site.dom_structure)
+            profile = {
+                'layout_sequence': layout_sequence,
+                'layout_counts': Counter(layout_sequence),
+                'layout_masks': _match_masks(layout_sequence),
+                'layout_classes': self._filter_layout_classes(site.css_classes),
+                'breakpoints': self._extract_breakpoints(site.responsive_features),
+                'layout_structure': extract_layout_structure(site.dom_structure),
             }
+            site._similarity_profile = profile
+        return profile
+
+    def _bounds(self, profile1: dict, profile2: dict) -> Tuple[Dict[str, float], float, float]:
+        """计算DOM结构以外各维度的相似度、它们的加权和，以及DOM相似度的上界
+
+        DOM比较（LCS）开销最大。LCS长度不超过两个序列中各元素出现次数较小值之和，
+        据此无需计算LCS即可得到DOM相似度的上界。
+        """
+        similarities = {
+            'css_similarity': self._calculate_css_similarity(
+                profile1['layout_classes'], profile2['layout_classes']
+            ),
+            'responsive_similarity': self._calculate_responsive_similarity(
+                profile1['breakpoints'], profile2['breakpoints']
+            ),
+            'layout_similarity': self._calculate_layout_similarity(
+                profile1['layout_structure'], profile2['layout_structure']
+            )
+        }
+        partial_similarity = sum(
+            similarities[key] * _WEIGHTS[key] for key in similarities
+        )
+
+        total_length = len(profile1['layout_sequence']) + len(profile2['layout_sequence'])
+        common = sum((profile1['layout_counts'] & profile2['layout_counts']).values())
+        dom_upper_bound = 2 * common / total_length if total_length > 0 else 0
+        return similarities, partial_similarity, dom_upper_bound
+
+    def _compare(self, site1: WebsiteFeatures, profile1: dict,
+                 site2: WebsiteFeatures, profile2: dict,
+                 cutoff: Optional[float] = None,
+                 bounds: Optional[Tuple[Dict[str, float], float, float]] = None) -> float:
+        """基于预先提取的中间结果计算两个网站的总体相似度
+
+        给定 cutoff 时先计算开销较小的维度，若DOM相似度取其上界也达不到 cutoff，
+        则跳过DOM比较，直接返回其余维度的加权和（低于 cutoff 的下界）。
+        bounds 为已经算好的 _bounds 结果，可避免重复计算。
+        """
+        try:
+            # 比较模板时每对网站都会调用，日志未开启时不做任何格式化
+            log_info = self.logger.isEnabledFor(logging.INFO)
+            if log_info:
+                self.logger.info("\n开始比较网站相似度:")
+                self.logger.info("网站1: %s", site1.url)
+                self.logger.info("网站2: %s", site2.url)
+
+            weights = _WEIGHTS
+            similarities, partial_similarity, dom_upper_bound = (
+                bounds if bounds is not None else self._bounds(profile1, profile2)
+            )
+            similarities = dict(similarities)
+
+            if cutoff is not None:
+                if partial_similarity + dom_upper_bound * weights['dom_similarity'] < cutoff:
+                    self.logger.info(
+                        "DOM相似度上界 %.2f%%，总体相似度达不到 %.2f%%，跳过DOM比较\n",
+                        dom_upper_bound * 100, cutoff * 100
+                    )
+                    return partial_similarity
+
+            similarities['dom_similarity'] = self._calculate_dom_similarity(
+                profile1['layout_sequence'], profile2['layout_sequence'], profile1['layout_masks']
+            )
 
             # 打印各维度的相似度
-            self.logger.info("\n各维度相似度:")
-            for key, value in similarities.items():
-                self.logger.info(f"{key}: {value:.2%} (权重: {weights[key]})")
+            if log_info:
+                self.logger.info("\n各维度相似度:")
+                for key in weights:
+                    self.logger.info("%s: %.2f%% (权重: %s)", key, similarities[key] * 100, weights[key])
 
-            total_similarity = sum(
-                similarities[key] * weights[key] for key in weights
+            # 与上界按同样的顺序求和，保证总体相似度不会因浮点误差超过上界
+            total_similarity = (
+                partial_similarity + similarities['dom_similarity'] * weights['dom_similarity']
             )
 
-            self.logger.info(f"\n总体相似度: {total_similarity:.2%}")
-            self.logger.info(f"相似度阈值: {self.threshold:.2%}")
-            self.logger.info(f"判定结果: {'相似' if total_similarity >= self.threshold else '不相似'}\n")
+            if log_info:
+                self.logger.info("\n总体相似度: %.2f%%", total_similarity * 100)
+                self.logger.info("相似度阈值: %.2f%%", self.threshold * 100)
+                self.logger.info(
+                    "判定结果: %s\n", '相似' if total_similarity >= self.threshold else '不相似'
+                )
 
             return total_similarity
             
@@ -56,60 +243,44 @@ class SimilarityAnalyzer:
             self.logger.error(f"计算相似度时出错: {str(e)}")
             return 0.0
 
-    def _calculate_dom_similarity(self, dom1: dict, dom2: dict) -> float:
-        """计算DOM结构相似度，主要关注主要布局元素"""
-        def get_layout_sequence(dom: dict) -> List[str]:
-            important_tags = {'div', 'section', 'main', 'header', 'footer', 'nav', 'aside'}
-            sequence = []
-            
-            def traverse(node, depth=0):
-                if isinstance(node, dict) and 'tag' in node:
-                    tag = node['tag']
-                    if tag in important_tags:
-                        sequence.append(f"{depth}:{tag}")
-                    for child in node.get('children', []):
-                        traverse(child, depth + 1)
-            
-            traverse(dom)
-            return sequence
-
-        seq1 = get_layout_sequence(dom1)
-        seq2 = get_layout_sequence(dom2)
+    def _calculate_dom_similarity(self, seq1: List[str], seq2: List[str],
+                                  masks1: Optional[Dict[str, int]] = None) -> float:
+        """计算DOM结构相似度，主要关注主要布局元素
 
-        self.logger.debug("\nDOM结构比较:")
-        self.logger.debug(f"网站1 DOM序列: {seq1}")
-        self.logger.debug(f"网站2 DOM序列: {seq2}")
+        masks1 为 seq1 预先算好的位置位图，同一序列与多个序列比较时可复用。
+        """
+        log_debug = self.logger.isEnabledFor(logging.DEBUG)
+        if log_debug:
+            self.logger.debug("\nDOM结构比较:")
+            self.logger.debug("网站1 DOM序列: %s", seq1)
+            self.logger.debug("网站2 DOM序列: %s", seq2)
+        
+        # 同一模板生成的页面布局序列往往完全相同，此时无需计算LCS
+        if seq1 == seq2:
+            return 1.0 if seq1 else 0
         
         # 使用最长公共子序列算法
-        matrix = np.zeros((len(seq1) + 1, len(seq2) + 1))
-        for i in range(1, len(seq1) + 1):
-            for j in range(1, len(seq2) + 1):
-                if seq1[i-1] == seq2[j-1]:
-                    matrix[i][j] = matrix[i-1][j-1] + 1
-                else:
-                    matrix[i][j] = max(matrix[i-1][j], matrix[i][j-1])
-
-        lcs_length = matrix[-1][-1]
+        lcs_length = _lcs_length(seq1, seq2, masks1)
         similarity = 2 * lcs_length / (len(seq1) + len(seq2)) if (len(seq1) + len(seq2)) > 0 else 0
         
-        self.logger.debug(f"最长公共子序列长度: {lcs_length}")
-        self.logger.debug(f"DOM相似度: {similarity:.2%}")
+        if log_debug:
+            self.logger.debug("最长公共子序列长度: %s", lcs_length)
+            self.logger.debug("DOM相似度: %.2f%%", similarity * 100)
         
         return similarity
 
-    def _calculate_css_similarity(self, classes1: List[str], classes2: List[str]) -> float:
-        """计算CSS类相似度，关注布局相关的类名"""
-        def filter_layout_classes(classes: List[str]) -> set:
-            layout_keywords = {'container', 'wrapper', 'header', 'footer', 'nav', 'sidebar', 
-                             'main', 'content', 'grid', 'flex', 'row', 'col', 'section'}
-            return {cls for cls in classes if any(keyword in cls.lower() for keyword in layout_keywords)}
-        
-        layout_classes1 = filter_layout_classes(classes1)
-        layout_classes2 = filter_layout_classes(classes2)
+    def _filter_layout_classes(self, classes: List[str]) -> set:
+        """筛选布局相关的CSS类名"""
+        search = _LAYOUT_RE.search
+        return {cls for cls in classes if search(cls.lower())}
 
-        self.logger.debug("\nCSS类比较:")
-        self.logger.debug(f"网站1布局相关类: {layout_classes1}")
-        self.logger.debug(f"网站2布局相关类: {layout_classes2}")
+    def _calculate_css_similarity(self, layout_classes1: set, layout_classes2: set) -> float:
+        """计算CSS类相似度，关注布局相关的类名"""
+        log_debug = self.logger.isEnabledFor(logging.DEBUG)
+        if log_debug:
+            self.logger.debug("\nCSS类比较:")
+            self.logger.debug("网站1布局相关类: %s", layout_classes1)
+            self.logger.debug("网站2布局相关类: %s", layout_classes2)
         
         if not layout_classes1 or not layout_classes2:
             self.logger.debug("未找到布局相关的CSS类")
@@ -119,107 +290,77 @@ class SimilarityAnalyzer:
         union = len(layout_classes1.union(layout_classes2))
         
         similarity = intersection / union if union > 0 else 0
-        self.logger.debug(f"共同类数量: {intersection}")
-        self.logger.debug(f"总类数量: {union}")
-        self.logger.debug(f"CSS相似度: {similarity:.2%}")
+        if log_debug:
+            self.logger.debug("共同类数量: %s", intersection)
+            self.logger.debug("总类数量: %s", union)
+            self.logger.debug("CSS相似度: %.2f%%", similarity * 100)
         
         return similarity
 
-    def _calculate_responsive_similarity(self, resp1: dict, resp2: dict) -> float:
-        """计算响应式设计相似度，主要关注布局断点"""
-        if not resp1 or not resp2:
-            self.logger.debug("\n未找到响应式设计特征")
-            return 0.0
-            
-        def extract_breakpoints(queries: List[str]) -> set:
-            import re
-            breakpoints = set()
-            for query in queries:
-                matches = re.findall(r'min-width:\s*(\d+)px', query)
-                breakpoints.update(map(int, matches))
-            return breakpoints
+    def _extract_breakpoints(self, resp: dict) -> set:
+        """提取媒体查询中的 min-width 断点"""
+        if not resp:
+            return set()
             
-        breakpoints1 = extract_breakpoints(resp1.get('mediaQueries', []))
-        breakpoints2 = extract_breakpoints(resp2.get('mediaQueries', []))
+        breakpoints = set()
+        for query in resp.get('mediaQueries', []):
+            breakpoints.update(map(int, _MIN_WIDTH_RE.findall(query)))
+        return breakpoints
 
-        self.logger.debug("\n响应式断点比较:")
-        self.logger.debug(f"网站1断点: {breakpoints1}")
-        self.logger.debug(f"网站2断点: {breakpoints2}")
+    def _calculate_responsive_similarity(self, breakpoints1: set, breakpoints2: set) -> float:
+        """计算响应式设计相似度，主要关注布局断点"""
+        log_debug = self.logger.isEnabledFor(logging.DEBUG)
+        if log_debug:
+            self.logger.debug("\n响应式断点比较:")
+            self.logger.debug("网站1断点: %s", breakpoints1)
+            self.logger.debug("网站2断点: %s", breakpoints2)
         
         if not breakpoints1 or not breakpoints2:
             self.logger.debug("未找到媒体查询断点")
             return 0.0
             
-        # 计算断点的相似度
+        # 计算断点的相似度：统计 breakpoints1 中有多少断点在 breakpoints2 里存在误差内的断点。
+        # 两边排序后单向推进指针，不必两两比较
         max_diff = 100  # 允许断点有100px的误差
         similar_breakpoints = 0
-        for bp1 in breakpoints1:
-            for bp2 in breakpoints2:
-                if abs(bp1 - bp2) <= max_diff:
-                    similar_breakpoints += 1
-                    self.logger.debug(f"匹配断点: {bp1}px ≈ {bp2}px")
-                    break
+        sorted2 = sorted(breakpoints2)
+        j = 0
+        for bp1 in sorted(breakpoints1):
+            while j < len(sorted2) and sorted2[j] < bp1 - max_diff:
+                j += 1
+            if j == len(sorted2):
+                break
+            if sorted2[j] <= bp1 + max_diff:
+                similar_breakpoints += 1
+                if log_debug:
+                    self.logger.debug("匹配断点: %spx ≈ %spx", bp1, sorted2[j])
                     
         similarity = similar_breakpoints / max(len(breakpoints1), len(breakpoints2))
-        self.logger.debug(f"响应式相似度: {similarity:.2%}")
+        if log_debug:
+            self.logger.debug("响应式相似度: %.2f%%", similarity * 100)
         
         return similarity
 
-    def _calculate_layout_similarity(self, dom1: dict, dom2: dict) -> float:
+    def _calculate_layout_similarity(self, struct1: List[tuple], struct2: List[tuple]) -> float:
         """计算页面布局相似度"""
-        def get_layout_structure(dom: dict) -> List[tuple]:
-            structure = []
-            
-            def analyze_node(node, parent_type='root'):
-                if isinstance(node, dict) and 'tag' in node:
-                    tag = node['tag']
-                    # 判断节点的布局类型
-                    layout_type = self._determine_layout_type(node)
-                    structure.append((parent_type, layout_type, len(node.get('children', []))))
-                    for child in node.get('children', []):
-                        analyze_node(child, layout_type)
-            
-            analyze_node(dom)
-            return structure
-
-        def compare_structures(struct1: List[tuple], struct2: List[tuple]) -> float:
-            # 计算两个结构的相似度
-            min_len = min(len(struct1), len(struct2))
-            max_len = max(len(struct1), len(struct2))
-            
-            matches = 0
-            for i in range(min_len):
-                # 比较父类型、布局类型和子元素数量
-                if (struct1[i][0] == struct2[i][0] and  # 相同的父类型
-                    struct1[i][1] == struct2[i][1] and  # 相同的布局类型
-                    abs(struct1[i][2] - struct2[i][2]) <= 2):  # 子元素数量相近
-                    matches += 1
-            
-            return matches / max_len if max_len > 0 else 0
-
-        layout1 = get_layout_structure(dom1)
-        layout2 = get_layout_structure(dom2)
-        return compare_structures(layout1, layout2)
-
-    def _determine_layout_type(self, node: dict) -> str:
-        """判断节点的布局类型"""
-        tag = node.get('tag', '').lower()
+        # 计算两个结构的相似度
+        min_len = min(len(struct1), len(struct2))
+        max_len = max(len(struct1), len(struct2))
         
-        # 定义布局类型映射
-        layout_tags = {
-            'header': 'header',
-            'footer': 'footer',
-            'nav': 'navigation',
-            'main': 'main-content',
-            'aside': 'sidebar',
-            'section': 'section',
-            'article': 'article',
-            'div': 'container'
-        }
+        matches = 0
+        for i in range(min_len):
+            # 比较父类型、布局类型和子元素数量
+            if (struct1[i][0] == struct2[i][0] and  # 相同的父类型
+                struct1[i][1] == struct2[i][1] and  # 相同的布局类型
+                abs(struct1[i][2] - struct2[i][2]) <= 2):  # 子元素数量相近
+                matches += 1
         
-        return layout_tags.get(tag, 'other')
+        return matches / max_len if max_len > 0 else 0
 
     def is_similar(self, site1: WebsiteFeatures, site2: WebsiteFeatures) -> bool:
         """判断两个网站是否相似"""
-        similarity = self.calculate_similarity(site1, site2)
+        similarity = self._compare(
+            site1, self._extract_profile(site1), site2, self._extract_profile(site2),
+            cutoff=self.threshold
+        )
         return similarity >= self.threshold
\ No newline at end of file
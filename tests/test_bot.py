@@ -0,0 +1,184 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from src.web_collector.bot import _MAX_MESSAGE_LENGTH, WebTemplateBot
+from src.web_collector.collector import WebsiteFeatures
+from src.web_collector.database import Database
+from src.web_collector.similarity import SimilarityAnalyzer
+
+
+class FakeMessage:
+    """记录回复和编辑内容的 Telegram 消息替身"""
+
+    def __init__(self, text=None):
+        self.text = text
+        self.replies = []
+        self.edits = []
+
+    async def reply_text(self, text):
+        reply = FakeMessage(text)
+        self.replies.append(reply)
+        return reply
+
+    async def edit_text(self, text):
+        self.edits.append(text)
+        self.text = text
+
+
+class FakeUpdate:
+    def __init__(self, text):
+        self.message = FakeMessage(text)
+
+
+class FakeContext:
+    def __init__(self, args):
+        self.args = args
+
+
+class FakeCollector:
+    """analyze_url 等到 release 被设置后才返回"""
+
+    def __init__(self):
+        self.calls = []
+        self.release = asyncio.Event()
+
+    async def analyze_url(self, url):
+        self.calls.append(url)
+        await self.release.wait()
+        now = datetime.now()
+        return WebsiteFeatures(
+            url=url,
+            dom_structure={"tag": "body", "children": [{"tag": "div", "children": []}]},
+            css_classes=["container"],
+            js_libraries=[],
+            responsive_features={"viewport": None, "mediaQueries": []},
+            color_scheme=[],
+            fonts=[],
+            performance_metrics={},
+            created_at=now,
+            updated_at=now
+        )
+
+
+async def _noop(*args, **kwargs):
+    pass
+
+
+@pytest.fixture
+async def bot():
+    collector = FakeCollector()
+    bot = WebTemplateBot("123:abc", Database(":memory:"), collector, SimilarityAnalyzer(0.4),
+                         concurrency=2)
+    bot.app.initialize = bot.app.start = bot.app.stop = _noop
+    bot.app.updater.start_polling = bot.app.updater.stop = _noop
+    await bot.start()
+    yield bot
+    collector.release.set()
+    await bot.stop()
+
+
+def last_text(update):
+    reply = update.message.replies[-1]
+    return reply.edits[-1] if reply.edits else reply.text
+
+
+async def test_duplicate_submission_is_analysed_once(bot):
+    first = FakeUpdate("https://example.com/a")
+    await bot.handle_message(first, None)
+    await asyncio.sleep(0)
+
+    # 同一网址和同一域名的其他网址在第一次分析完成前到达
+    second = FakeUpdate("https://example.com/a")
+    third = FakeUpdate("https://EXAMPLE.com/b")
+    await bot.handle_message(second, None)
+    await bot.handle_message(third, None)
+    assert "正在分析中" in last_text(second)
+    assert "正在分析中" in last_text(third)
+
+    bot.collector.release.set()
+    await bot._queue.join()
+    assert bot.collector.calls == ["https://example.com/a"]
+    assert "分析完成" in last_text(first)
+
+    # 入库后再次发送直接从数据库回复
+    fourth = FakeUpdate("https://example.com/c")
+    await bot.handle_message(fourth, None)
+    assert "已存在于数据库中" in last_text(fourth)
+    assert bot.collector.calls == ["https://example.com/a"]
+
+
+async def test_worker_rechecks_database_before_analysing(bot):
+    # 排队期间该域名已由其他途径入库
+    await bot.db.save_website("https://example.com/x", await _features("https://example.com/x"))
+    wait_message = FakeMessage("⏳")
+    bot.collector.release.set()
+    await bot._analyze_and_reply("https://example.com/y", wait_message)
+    assert bot.collector.calls == []
+    assert "已存在于数据库中" in wait_message.edits[-1]
+
+
+async def _features(url):
+    collector = FakeCollector()
+    collector.release.set()
+    return await collector.analyze_url(url)
+
+
+async def test_stop_notifies_pending_users():
+    collector = FakeCollector()
+    bot = WebTemplateBot("123:abc", Database(":memory:"), collector, SimilarityAnalyzer(0.4),
+                         concurrency=1)
+    bot.app.initialize = bot.app.start = bot.app.stop = _noop
+    bot.app.updater.start_polling = bot.app.updater.stop = _noop
+    await bot.start()
+
+    updates = [FakeUpdate(f"https://site{i}.com") for i in range(3)]
+    for update in updates:
+        await bot.handle_message(update, None)
+    await asyncio.sleep(0)
+    assert collector.calls == ["https://site0.com"]
+
+    # 一个正在分析、两个仍在排队，关闭后都不会再停留在等待提示上
+    await bot.stop()
+    for update in updates:
+        assert "机器人正在关闭" in last_text(update)
+    assert not bot._pending_hosts
+
+
+class FakeTemplateDatabase:
+    def __init__(self, urls):
+        self.urls = urls
+
+    async def get_template_websites(self, template_id):
+        return [{'url': url} for url in self.urls]
+
+
+async def run_template_command(urls):
+    bot = WebTemplateBot("123:abc", FakeTemplateDatabase(urls), FakeCollector(),
+                         SimilarityAnalyzer(0.4))
+    update = FakeUpdate("/template 1")
+    await bot.template_command(update, FakeContext(["1"]))
+    return [reply.text for reply in update.message.replies]
+
+
+async def test_template_command_chunks_long_lists():
+    urls = [f"https://site{i}.example.com/{'p' * (i % 50)}" for i in range(500)]
+    chunks = await run_template_command(urls)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= _MAX_MESSAGE_LENGTH for chunk in chunks)
+    assert chunks[0].startswith("📑 模板 #1 的网站列表")
+
+    # 每个网址完整地出现在某一条消息中，且顺序不变
+    lines = [line for chunk in chunks for line in chunk.splitlines() if line.startswith("• ")]
+    assert lines == [f"• {url}" for url in urls]
+
+
+async def test_template_command_splits_oversized_line():
+    long_url = "https://example.com/" + "x" * (2 * _MAX_MESSAGE_LENGTH)
+    urls = ["https://a.com", long_url, "https://b.com"]
+    chunks = await run_template_command(urls)
+    assert all(0 < len(chunk) <= _MAX_MESSAGE_LENGTH for chunk in chunks)
+    assert "".join(chunks) == (
+        "📑 模板 #1 的网站列表：\n\n" + "".join(f"• {url}\n" for url in urls)
+    )
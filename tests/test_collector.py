@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+from src.web_collector.collector import _decode_dom_structure
+
+
+def encode_dom_structure(root, max_nodes=10000, max_depth=64):
+    """_DOM_STRUCTURE_JS 的 Python 版本，输入为 {'tag', 'children'} 嵌套结构"""
+    tag_table, tag_ids, tags, child_counts = [], {}, [], []
+    truncated = False
+    stack = [(root, 0)]
+    while stack:
+        if len(tags) >= max_nodes:
+            truncated = True
+            break
+        node, depth = stack.pop()
+        tag = node['tag']
+        if tag not in tag_ids:
+            tag_ids[tag] = len(tag_table)
+            tag_table.append(tag)
+        tags.append(tag_ids[tag])
+        children = node['children']
+        if depth >= max_depth:
+            truncated = truncated or bool(children)
+            child_counts.append(0)
+            continue
+        child_counts.append(len(children))
+        for child in reversed(children):
+            stack.append((child, depth + 1))
+    return {'tagTable': tag_table, 'tags': tags, 'childCounts': child_counts, 'truncated': truncated}
+
+
+def random_dom(rnd, depth=0, max_depth=8):
+    node = {'tag': rnd.choice(['body', 'div', 'section', 'span', 'p', 'a', 'svg', 'nav']),
+            'children': []}
+    if depth < max_depth:
+        for _ in range(rnd.randint(0, 4)):
+            node['children'].append(random_dom(rnd, depth + 1, max_depth))
+    return node
+
+
+def cut_depth(node, max_depth, depth=0):
+    """去掉深度超过 max_depth 的节点"""
+    children = [] if depth >= max_depth else [
+        cut_depth(child, max_depth, depth + 1) for child in node['children']
+    ]
+    return {'tag': node['tag'], 'children': children}
+
+
+def count_nodes(node):
+    return 1 + sum(count_nodes(child) for child in node['children'])
+
+
+def preorder_tags(node):
+    tags = [node['tag']]
+    for child in node['children']:
+        tags.extend(preorder_tags(child))
+    return tags
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_decode_dom_structure_round_trip(seed):
+    dom = random_dom(random.Random(seed))
+    encoded = encode_dom_structure(dom)
+    assert not encoded['truncated']
+    assert _decode_dom_structure(encoded) == dom
+
+
+def test_decode_empty_dom_structure():
+    encoded = {'tagTable': [], 'tags': [], 'childCounts': [], 'truncated': False}
+    assert _decode_dom_structure(encoded) == {"tag": "body", "children": []}
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_decode_depth_limited_dom_structure(seed):
+    dom = random_dom(random.Random(seed), max_depth=10)
+    encoded = encode_dom_structure(dom, max_depth=3)
+    assert _decode_dom_structure(encoded) == cut_depth(dom, 3)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_decode_truncated_dom_structure(seed):
+    # 达到节点上限时编码只是先序序列的前缀，祖先的子节点数多于实际收到的节点
+    dom = random_dom(random.Random(seed))
+    total = count_nodes(dom)
+    max_nodes = max(1, total // 2)
+    encoded = encode_dom_structure(dom, max_nodes=max_nodes)
+    decoded = _decode_dom_structure(encoded)
+    assert count_nodes(decoded) == len(encoded['tags']) == min(total, max_nodes)
+    assert preorder_tags(decoded) == preorder_tags(dom)[:max_nodes]
@@ -0,0 +1,62 @@
+from src.web_collector.config import Config
+
+CONFIG_YAML = """
+telegram:
+  token: "abc"
+  admin_users:
+    - 123
+database:
+  path: "test.db"
+collector:
+  timeout: 120
+  js_libraries:
+    - name: jQuery
+      global: jQuery
+similarity:
+  threshold: 0.4
+"""
+
+
+def load(tmp_path, text=CONFIG_YAML):
+    path = tmp_path / "config.yml"
+    path.write_text(text)
+    return Config(str(path))
+
+
+def test_get_nested_keys(tmp_path):
+    config = load(tmp_path)
+    assert config.get('telegram.token') == "abc"
+    assert config.get('collector.timeout') == 120
+    assert config.get('similarity.threshold') == 0.4
+    # 中间层级返回整个子字典
+    assert config.get('database') == {'path': "test.db"}
+
+
+def test_get_missing_keys_returns_default(tmp_path):
+    config = load(tmp_path)
+    assert config.get('cleanup.days') is None
+    assert config.get('cleanup.days', 30) == 30
+    assert config.get('collector.concurrency', 4) == 4
+    assert config.get('', 'default') == 'default'
+
+
+def test_get_non_dict_leaf(tmp_path):
+    config = load(tmp_path)
+    assert config.get('telegram.admin_users') == [123]
+    assert config.get('collector.js_libraries') == [{'name': 'jQuery', 'global': 'jQuery'}]
+    # 列表和标量下面没有子键
+    assert config.get('telegram.admin_users.0', 'x') == 'x'
+    assert config.get('collector.js_libraries.name', 'x') == 'x'
+    assert config.get('collector.timeout.seconds', 'x') == 'x'
+
+
+def test_empty_file_returns_defaults(tmp_path):
+    config = load(tmp_path, "")
+    assert config.get('collector.timeout', 30) == 30
+
+
+def test_missing_file_uses_default_config(tmp_path):
+    config = Config(str(tmp_path / "missing.yml"))
+    assert config.get('collector.timeout') == 30
+    assert config.get('similarity.threshold') == 0.85
+    assert config.get('telegram.admin_users') == []
@@ -0,0 +1,239 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from src.web_collector.collector import WebsiteFeatures
+from src.web_collector import database as database_module
+from src.web_collector.database import Database
+
+# 加入 host 列之前的 websites/templates 表结构
+OLD_SCHEMA = """
+    CREATE TABLE websites (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        url TEXT UNIQUE NOT NULL,
+        template_id INTEGER,
+        first_analyzed_at TIMESTAMP,
+        last_updated_at TIMESTAMP,
+        status TEXT,
+        features JSON,
+        FOREIGN KEY (template_id) REFERENCES templates (id)
+    );
+    CREATE TABLE templates (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at TIMESTAMP,
+        website_count INTEGER DEFAULT 0,
+        feature_summary JSON,
+        last_updated_at TIMESTAMP
+    );
+"""
+
+
+def make_features(url):
+    now = datetime.now()
+    return WebsiteFeatures(
+        url=url,
+        dom_structure={"tag": "body", "children": [{"tag": "div", "children": []}]},
+        css_classes=["container"],
+        js_libraries=[],
+        responsive_features={"viewport": None, "mediaQueries": []},
+        color_scheme=[],
+        fonts=[],
+        performance_metrics={},
+        created_at=now,
+        updated_at=now
+    )
+
+
+@pytest.fixture
+async def db():
+    database = Database(":memory:")
+    await database.initialize()
+    yield database
+    await database.close()
+
+
+async def test_initialize_migrates_host_column(tmp_path):
+    path = str(tmp_path / "old.db")
+    now = datetime.now()
+    with sqlite3.connect(path) as conn:
+        conn.executescript(OLD_SCHEMA)
+        conn.executemany(
+            "INSERT INTO websites (url, first_analyzed_at, last_updated_at, status, features) "
+            "VALUES (?, ?, ?, 'analyzed', ?)",
+            [
+                ("https://Old.COM/page", now, now, make_features("https://Old.COM/page").to_json()),
+                ("http://www.Example.org:8080/", now, now, make_features("x").to_json()),
+            ]
+        )
+    conn.close()
+
+    database = Database(path)
+    await database.initialize()
+    try:
+        async with database.db.execute("SELECT url, host FROM websites ORDER BY id") as cursor:
+            rows = await cursor.fetchall()
+        assert rows == [
+            ("https://Old.COM/page", "old.com"),
+            ("http://www.Example.org:8080/", "www.example.org:8080"),
+        ]
+
+        website = await database.get_website_by_host("https://old.com/another")
+        assert website is not None
+        assert website["url"] == "https://Old.COM/page"
+        # 不再像 LIKE '%host%' 那样匹配包含该域名的其他域名
+        assert await database.get_website_by_host("https://ld.com/") is None
+
+        # 再次初始化不会重复迁移
+        await database.initialize()
+    finally:
+        await database.close()
+
+
+async def test_save_website_sets_host(db):
+    website_id, template_id = await db.save_website("https://New.example.com/a", make_features("a"))
+    website = await db.get_website_by_host("https://new.EXAMPLE.com/b")
+    assert website["id"] == website_id
+    assert website["host"] == "new.example.com"
+    assert website["template_id"] == template_id
+
+
+async def test_add_websites_bulk_returns_ids_in_input_order(db):
+    assert await db.add_websites_bulk([]) == []
+
+    urls = ["https://c.com", "https://a.com", "https://B.com/x"]
+    ids = await db.add_websites_bulk([(url, make_features(url)) for url in urls])
+    assert len(ids) == len(set(ids)) == 3
+
+    async with db.db.execute("SELECT id, url, host FROM websites") as cursor:
+        rows = {website_id: (url, host) for website_id, url, host in await cursor.fetchall()}
+    assert [rows[website_id][0] for website_id in ids] == urls
+    assert rows[ids[2]][1] == "b.com"
+
+
+async def test_add_websites_bulk_rolls_back_on_duplicate(db):
+    await db.add_website("https://exists.com", make_features("https://exists.com"))
+
+    batch = [
+        ("https://new1.com", make_features("https://new1.com")),
+        ("https://exists.com", make_features("https://exists.com")),
+        ("https://new2.com", make_features("https://new2.com")),
+    ]
+    with pytest.raises(sqlite3.IntegrityError):
+        await db.add_websites_bulk(batch)
+
+    async with db.db.execute("SELECT url FROM websites") as cursor:
+        assert await cursor.fetchall() == [("https://exists.com",)]
+
+    # 回滚后连接仍然可用
+    ids = await db.add_websites_bulk(batch[::2])
+    assert len(ids) == 2
+
+
+async def template_count(db, template_id):
+    async with db.db.execute(
+        "SELECT website_count FROM templates WHERE id = ?", (template_id,)
+    ) as cursor:
+        return (await cursor.fetchone())[0]
+
+
+async def test_update_template_count_recounts_websites(db):
+    _, template_id = await db.save_website("https://a.com", make_features("https://a.com"))
+    website_id = await db.add_website("https://b.com", make_features("https://b.com"))
+    await db.update_website_template(website_id, template_id)
+    assert await template_count(db, template_id) == 1
+
+    await db.update_template_count(template_id)
+    assert await template_count(db, template_id) == 2
+
+
+async def test_save_website_recounts_matched_template(db):
+    _, template_id = await db.save_website("https://a.com", make_features("https://a.com"))
+    # 人为制造计数漂移，归入模板时按实际网站数纠正
+    await db.db.execute("UPDATE templates SET website_count = 10 WHERE id = ?", (template_id,))
+    await db.db.commit()
+    await db.save_website("https://b.com", make_features("https://b.com"), template_id)
+    assert await template_count(db, template_id) == 2
+
+
+@pytest.mark.parametrize("has_returning", [True, False])
+async def test_create_template_from_website(db, monkeypatch, has_returning):
+    monkeypatch.setattr(database_module, "_SQLITE_HAS_RETURNING", has_returning)
+    website_id = await db.add_website("https://a.com", make_features("https://a.com"))
+    template_id = await db.create_template_from_website(website_id)
+
+    async with db.db.execute(
+        """
+        SELECT t.website_count, t.feature_summary = w.features, w.template_id
+        FROM templates t, websites w
+        WHERE t.id = ? AND w.id = ?
+        """,
+        (template_id, website_id)
+    ) as cursor:
+        assert await cursor.fetchone() == (1, 1, template_id)
+
+    with pytest.raises(ValueError):
+        await db.create_template_from_website(website_id + 100)
+    async with db.db.execute("SELECT COUNT(*) FROM templates") as cursor:
+        assert (await cursor.fetchone())[0] == 1
+
+
+def count_loads(monkeypatch):
+    calls = []
+    original = database_module.serialization.loads
+
+    def loads(data):
+        calls.append(data)
+        return original(data)
+
+    monkeypatch.setattr(database_module.serialization, "loads", loads)
+    return calls
+
+
+async def test_template_features_cache_hit(db, monkeypatch):
+    _, template_id = await db.save_website("https://a.com", make_features("https://a.com"))
+    loads = count_loads(monkeypatch)
+
+    first = await db.get_template_features()
+    assert [tid for tid, _ in first] == [template_id]
+    assert first[0][1].url == "https://a.com"
+    assert len(loads) == 1
+
+    # 没有变化时直接返回缓存的同一个对象，不再解析
+    second = await db.get_template_features()
+    assert second[0][1] is first[0][1]
+    assert len(loads) == 1
+
+
+async def test_template_features_cache_picks_up_new_template(db, monkeypatch):
+    _, template1 = await db.save_website("https://a.com", make_features("https://a.com"))
+    cached = dict(await db.get_template_features())
+    loads = count_loads(monkeypatch)
+
+    _, template2 = await db.save_website("https://b.com", make_features("https://b.com"))
+    # 归入已有模板不改变代表网站
+    await db.save_website("https://c.com", make_features("https://c.com"), template1)
+    features = dict(await db.get_template_features())
+    assert set(features) == {template1, template2}
+    assert features[template1] is cached[template1]
+    assert features[template2].url == "https://b.com"
+    assert len(loads) == 1
+
+
+async def test_template_features_cache_after_cleanup(db):
+    _, template1 = await db.save_website("https://a.com", make_features("https://a.com"))
+    await db.save_website("https://b.com", make_features("https://b.com"), template1)
+    _, template2 = await db.save_website("https://c.com", make_features("https://c.com"))
+    assert set(dict(await db.get_template_features())) == {template1, template2}
+
+    # 模板1的代表网站和模板2唯一的网站都已过期
+    await db.db.execute(
+        "UPDATE websites SET last_updated_at = '2000-01-01 00:00:00' WHERE url IN (?, ?)",
+        ("https://a.com", "https://c.com")
+    )
+    await db.db.commit()
+    await db.cleanup_old_records(30)
+
+    features = dict(await db.get_template_features())
+    assert set(features) == {template1}
+    assert features[template1].url == "https://b.com"
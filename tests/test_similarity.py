@@ -0,0 +1,130 @@
+import random
+from datetime import datetime
+
+import pytest
+
+from src.web_collector.collector import WebsiteFeatures
+from src.web_collector.similarity import SimilarityAnalyzer, _lcs_length, _match_masks
+
+TAGS = ['div', 'section', 'main', 'header', 'footer', 'nav', 'aside', 'span', 'p', 'a', 'article']
+CLASS_WORDS = ['container', 'wrapper', 'header', 'footer', 'nav', 'sidebar', 'main', 'content',
+               'grid', 'flex', 'row', 'col', 'section', 'btn', 'Title']
+BREAKPOINTS = [320, 480, 576, 600, 768, 992, 1024, 1200, 1400]
+
+
+def reference_lcs(seq1, seq2):
+    """经典 O(n*m) 动态规划"""
+    prev = [0] * (len(seq2) + 1)
+    for a in seq1:
+        cur = [0]
+        for j, b in enumerate(seq2):
+            cur.append(prev[j] + 1 if a == b else max(prev[j + 1], cur[j]))
+        prev = cur
+    return prev[-1]
+
+
+def random_dom(rnd, depth=0):
+    node = {'tag': rnd.choice(TAGS), 'children': []}
+    if depth < rnd.randint(2, 6):
+        for _ in range(rnd.randint(0, 4)):
+            node['children'].append(random_dom(rnd, depth + 1))
+    return node
+
+
+def random_features(rnd):
+    media_queries = [
+        f"(min-width: {rnd.choice(BREAKPOINTS)}px)" for _ in range(rnd.randint(0, 5))
+    ]
+    now = datetime.now()
+    return WebsiteFeatures(
+        url=f"https://site{rnd.randint(0, 999)}.com",
+        dom_structure=random_dom(rnd),
+        css_classes=[rnd.choice(CLASS_WORDS) + str(rnd.randint(0, 3)) for _ in range(rnd.randint(0, 12))],
+        js_libraries=[],
+        responsive_features={'viewport': None, 'mediaQueries': media_queries},
+        color_scheme=[],
+        fonts=[],
+        performance_metrics={},
+        created_at=now,
+        updated_at=now
+    )
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_lcs_length_matches_dp(seed):
+    rnd = random.Random(seed)
+    alphabet = 'abcdef'[:rnd.randint(1, 6)]
+    seq1 = [rnd.choice(alphabet) for _ in range(rnd.randint(0, 80))]
+    seq2 = [rnd.choice(alphabet) for _ in range(rnd.randint(0, 80))]
+    expected = reference_lcs(seq1, seq2)
+    assert _lcs_length(seq1, seq2) == expected
+    assert _lcs_length(seq1, seq2, _match_masks(seq1)) == expected
+
+
+def test_lcs_length_long_sequences():
+    # 超过机器字长的序列也必须正确
+    rnd = random.Random(0)
+    seq1 = [rnd.choice('abc') for _ in range(300)]
+    seq2 = [rnd.choice('abcd') for _ in range(250)]
+    assert _lcs_length(seq1, seq2) == reference_lcs(seq1, seq2)
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_responsive_similarity_matches_pairwise(seed):
+    rnd = random.Random(seed)
+    breakpoints1 = {rnd.randint(200, 1600) for _ in range(rnd.randint(1, 8))}
+    breakpoints2 = {rnd.randint(200, 1600) for _ in range(rnd.randint(1, 8))}
+    matched = sum(
+        1 for bp1 in breakpoints1 if any(abs(bp1 - bp2) <= 100 for bp2 in breakpoints2)
+    )
+    expected = matched / max(len(breakpoints1), len(breakpoints2))
+    analyzer = SimilarityAnalyzer()
+    assert analyzer._calculate_responsive_similarity(breakpoints1, breakpoints2) == expected
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_find_best_match_matches_exhaustive_search(seed):
+    rnd = random.Random(seed)
+    threshold = rnd.choice([0.2, 0.3, 0.4, 0.5, 0.6, 0.85])
+    site_seed = rnd.randrange(10 ** 6)
+    template_seeds = [rnd.randrange(10 ** 6) for _ in range(rnd.randint(0, 30))]
+    # 重复的模板用来检查相同相似度时取排在前面的一个
+    for _ in range(rnd.randint(0, 3)):
+        if template_seeds:
+            template_seeds.insert(rnd.randint(0, len(template_seeds)), rnd.choice(template_seeds))
+    if rnd.random() < 0.5:
+        template_seeds.insert(rnd.randint(0, len(template_seeds)), site_seed)
+
+    def build():
+        site = random_features(random.Random(site_seed))
+        templates = [
+            (i + 1, random_features(random.Random(s))) for i, s in enumerate(template_seeds)
+        ]
+        return site, templates
+
+    # 逐个比较的结果，特征对象各自独立，不共享缓存
+    analyzer = SimilarityAnalyzer(threshold)
+    site, templates = build()
+    best_id, best_similarity = None, 0.0
+    for template_id, template in templates:
+        similarity = analyzer.calculate_similarity(site, template)
+        if similarity > best_similarity:
+            best_id, best_similarity = template_id, similarity
+
+    site, templates = build()
+    found_id, found_similarity = SimilarityAnalyzer(threshold).find_best_match(site, templates)
+    if best_similarity >= threshold:
+        assert found_id == best_id
+        assert found_similarity == pytest.approx(best_similarity, abs=1e-12)
+    else:
+        assert found_similarity < threshold
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_is_similar_matches_calculate_similarity(seed):
+    rnd = random.Random(seed)
+    analyzer = SimilarityAnalyzer(rnd.choice([0.2, 0.4, 0.6]))
+    site1 = random_features(rnd)
+    site2 = random_features(rnd)
+    expected = analyzer.calculate_similarity(site1, site2) >= analyzer.threshold
+    assert analyzer.is_similar(site1, site2) == expected